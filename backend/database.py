@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Index, UniqueConstraint, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from passlib.context import CryptContext
@@ -63,9 +63,34 @@ class Wallet(Base):
     balance = Column(Float, default=0.0)
 
 
+# Optional sub-balances for hot vendor wallets (see utils/wallet_shards.py).
+# Wallet balance = wallets.balance + SUM(shards) until the consolidation job folds them in.
+class WalletBalanceShard(Base):
+    __tablename__ = "wallet_balance_shards"
+    __table_args__ = (UniqueConstraint("wallet_id", "shard"),)
+
+    id = Column(Integer, primary_key=True)
+    wallet_id = Column(String, index=True, nullable=False)
+    shard = Column(Integer, nullable=False)
+    balance = Column(Float, default=0.0)
+
+
+# Worker ids of the wallet ID allocator (see utils/gen_wallet.py), leased per process
+class WalletIdWorker(Base):
+    __tablename__ = "wallet_id_workers"
+
+    worker_id = Column(Integer, primary_key=True, autoincrement=False)
+    owner = Column(String, nullable=False)  # host:pid:nonce of the holder
+    expires_at = Column(DateTime, nullable=False)
+
+
 # ---------------- TRANSACTIONS ----------------
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_receiver_status_timestamp", "receiver_id", "receiver_type", "status", "timestamp"),
+        Index("ix_transactions_sender_status_timestamp", "sender_id", "status", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     sender_id = Column(Integer, index=True)         # user sending money
@@ -83,8 +108,13 @@ class Transaction(Base):
 # Expense categorization
 class Expense(Base):
     __tablename__ = "expenses"
+    __table_args__ = (
+        Index("ix_expenses_user_timestamp", "user_id", "timestamp"),
+        Index("ix_expenses_user_merchant_timestamp", "user_id", "merchant_name", "timestamp"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), unique=True, index=True)  # the payment it came from, at most one expense each
     merchant_name = Column(String, nullable=False)
     merchant_category = Column(String, nullable=False)
     amount = Column(Float, nullable=False)
@@ -93,9 +123,137 @@ class Expense(Base):
     urgency = Column(String)
 
 
+# Stored Scan & Pay responses for client-supplied Idempotency-Key headers
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    key = Column(String, nullable=False)
+    request_fingerprint = Column(String, nullable=False)
+    response = Column(String, nullable=False)  # JSON body returned the first time
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Two most recent expense timestamps per (user, merchant): "recurring" means
+# >= 2 expenses in the lookback window, i.e. prev_seen falls inside it.
+class MerchantRecurrence(Base):
+    __tablename__ = "merchant_recurrence"
+    __table_args__ = (UniqueConstraint("user_id", "merchant_name"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    merchant_name = Column(String, nullable=False)
+    last_seen = Column(DateTime, nullable=False)
+    prev_seen = Column(DateTime, nullable=True)
+
+
+# Per-user spend per day, category and urgency, kept in step with expenses.
+# Missing category / urgency are stored as "uncategorized" / "" so the key is never NULL.
+class DailySpend(Base):
+    __tablename__ = "daily_spend"
+    __table_args__ = (UniqueConstraint("user_id", "day", "category", "urgency"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    day = Column(DateTime, nullable=False)  # midnight UTC
+    category = Column(String, nullable=False)
+    urgency = Column(String, nullable=False)
+    amount = Column(Float, nullable=False, default=0.0)
+    expenses = Column(Integer, nullable=False, default=0)
+
+
+# Running spend per user, calendar month (UTC) and merchant category, as
+# normalized for spend limits (stripped, title-case). Read by alerts / coach.
+class MonthlyCategorySpend(Base):
+    __tablename__ = "monthly_category_spend"
+    __table_args__ = (UniqueConstraint("user_id", "month", "category"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    month = Column(DateTime, nullable=False)  # first day of the month, 00:00
+    category = Column(String, nullable=False)
+    amount = Column(Float, nullable=False, default=0.0)
+    expenses = Column(Integer, nullable=False, default=0)
+
+
+# Bumped whenever a user's expenses change; cached per-user results are keyed by it
+class UserDataVersion(Base):
+    __tablename__ = "user_data_versions"
+
+    user_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Bumped whenever a user's spend limits are saved; every process keys its limit cache by it
+class UserLimitVersion(Base):
+    __tablename__ = "user_limit_versions"
+
+    user_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Vendor revenue per hour / day / month bucket, updated with each received payment.
+# Hot vendors spread a bucket over `shard` rows (see VENDOR_WALLET_SHARDS); readers sum them.
+class VendorRevenueRollup(Base):
+    __tablename__ = "vendor_revenue_rollups"
+    __table_args__ = (UniqueConstraint("vendor_id", "granularity", "bucket", "shard"),)
+
+    id = Column(Integer, primary_key=True)
+    vendor_id = Column(Integer, nullable=False)
+    granularity = Column(String, nullable=False)  # hour / day / month
+    bucket = Column(DateTime, nullable=False)     # bucket start (UTC)
+    shard = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    payments = Column(Integer, nullable=False, default=0)
+
+
+# What each payer paid a vendor per day: unique payers / top payers for any day range
+class VendorDailyPayer(Base):
+    __tablename__ = "vendor_daily_payers"
+    __table_args__ = (UniqueConstraint("vendor_id", "day", "user_id"),)
+
+    id = Column(Integer, primary_key=True)
+    vendor_id = Column(Integer, nullable=False)
+    day = Column(DateTime, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    amount = Column(Float, nullable=False, default=0.0)
+    payments = Column(Integer, nullable=False, default=0)
+
+
+# Deferred Scan & Pay bookkeeping: one row per committed transaction whose
+# Expense / categorization is still owed (PAYMENT_CATEGORIZATION_MODE=deferred)
+class PostPaymentJob(Base):
+    __tablename__ = "post_payment_jobs"
+
+    id = Column(Integer, primary_key=True)
+    transaction_id = Column(Integer, unique=True, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    merchant_name = Column(String, nullable=False)
+    merchant_category = Column(String, nullable=False)
+    amount = Column(Float, nullable=False)
+    user_balance_pre = Column(Float, nullable=False)
+    created_at = Column(DateTime, nullable=False)  # payment time, used as the expense timestamp
+
+    status = Column(String, nullable=False, default="pending", index=True)  # pending / processing / done / failed
+    claimed_at = Column(DateTime)  # lease start while processing (see POST_PAYMENT_LEASE_SECONDS)
+    claimed_by = Column(String)    # host:pid of the worker holding the lease
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String)
+    expense_id = Column(Integer)
+    category = Column(String)
+    urgency = Column(String)
+    processed_at = Column(DateTime)
+
+
 class UserSpendLimit(Base):
     __tablename__ = "user_spend_limits"
-    
+    # One row per (user, category): limits are written with upserts
+    __table_args__ = (Index("uq_user_spend_limits_user_category", "user_id", "category", unique=True),)
+
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
     category = Column(String, nullable=False)
@@ -116,7 +274,7 @@ class CoachConversation(Base):
 
 class FinancialNudge(Base):
     __tablename__ = "financial_nudges"
-
+    __table_args__ = (Index("ix_financial_nudges_user_type_delivered", "user_id", "nudge_type", "delivered_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
@@ -125,5 +283,44 @@ class FinancialNudge(Base):
     message = Column(String)
     delivered_at = Column(DateTime, default=datetime.utcnow)
 
+# Applied schema migrations (see backend/migrations.py)
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+
+    # create_all never alters existing tables; columns / indexes added later are migrations
+    from backend.migrations import upgrade
+    upgrade()
+
+
+def dialect_insert(db):
+    """INSERT construct with on_conflict_do_update for the session's backend."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def begin_write(db):
+    """
+    Open the session's transaction as a write transaction.
+
+    SQLite only upgrades to the write lock on the first write, and two
+    deferred transactions racing for that upgrade fail with "database is
+    locked". BEGIN IMMEDIATE takes the lock up front so concurrent payments
+    wait on the busy timeout instead. Other backends rely on row locks.
+    """
+    connection = db.connection()
+    if connection.dialect.name != "sqlite":
+        return
+
+    if not connection.connection.driver_connection.in_transaction:
+        connection.execute(text("BEGIN IMMEDIATE"))
\ No newline at end of file
@@ -9,12 +9,26 @@ import os
 load_dotenv()
 
 import backend.database as database
-from backend.routes import auth, scan_pay, insights, spend_limit, coach, savings, investment, nudges, wallet
+from backend.routes import auth, scan_pay, insights, spend_limit, coach, savings, investment, nudges, wallet, vendor_analytics
 
 from backend.utils.nudge_scheduler import start_scheduler
+from backend.utils.recurrence import backfill_if_empty as backfill_recurrence
+from backend.utils.daily_spend import backfill_if_empty as backfill_daily_spend
+from backend.utils.category_spend import backfill_if_empty as backfill_category_spend
+from backend.utils.vendor_analytics import backfill_if_empty as backfill_vendor_rollups
+from backend.utils.post_payment import is_deferred, start_post_payment_worker
 
 database.init_db()
 
+# First start after upgrading: seed the recurrence table, daily spend rollup
+# and monthly category counters from existing expenses and vendor rollups
+# from past payments (linking legacy expenses is migration 6)
+with database.SessionLocal() as _db:
+    backfill_recurrence(_db)
+    backfill_daily_spend(_db)
+    backfill_category_spend(_db)
+    backfill_vendor_rollups(_db)
+
 app = FastAPI(title="Smart Finance Management System")
 
 origins = [
@@ -29,6 +43,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],          # allow all HTTP methods
     allow_headers=["*"],          # allow all headers
+    expose_headers=["X-Next-Cursor"],  # history pagination cursor
 )
 
 app.include_router(auth.router)
@@ -40,6 +55,7 @@ app.include_router(savings.router)  # step 7
 app.include_router(investment.router)
 app.include_router(nudges.router)
 app.include_router(wallet.router)
+app.include_router(vendor_analytics.router)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 FRONTEND_DIR = os.path.join(BASE_DIR, "../frontend")
@@ -69,6 +85,8 @@ def serve_dashboard():
 @app.on_event("startup")
 def start_background_jobs():
     start_scheduler()
+    if is_deferred():
+        start_post_payment_worker()
 
 
 
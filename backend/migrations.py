@@ -0,0 +1,217 @@
+"""
+Versioned schema migrations for existing databases.
+
+`database.init_db()` creates missing tables with create_all, which never
+touches tables that already exist. Changes to existing tables (new
+columns, new indexes) are listed here as numbered steps. Applied versions
+are recorded in `schema_version`, so each step runs once per database.
+
+Steps must be idempotent: on a fresh database create_all has already
+produced the current schema, and the step only records its version.
+One-shot data migrations are steps too, so they run once, not per start.
+
+    python -m backend.migrations {upgrade,status,dedupe-expenses}
+"""
+import argparse
+from datetime import datetime
+
+from loguru import logger
+from sqlalchemy import inspect, text
+
+import backend.database as database
+
+# Arbitrary key for pg_advisory_xact_lock: one migrating process at a time
+ADVISORY_LOCK_KEY = 72_310_001
+
+
+def _create_indexes(connection, table, names):
+    """Create the model-declared indexes `names` on `table` if missing."""
+    for index in table.indexes:
+        if index.name in names:
+            index.create(connection, checkfirst=True)
+
+
+def _expense_transaction_link(connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("expenses")}
+    if "transaction_id" not in columns:
+        connection.execute(text("ALTER TABLE expenses ADD COLUMN transaction_id INTEGER REFERENCES transactions(id)"))
+    _create_indexes(connection, database.Expense.__table__, {"ix_expenses_transaction_id"})
+
+
+def _hot_query_indexes(connection):
+    _create_indexes(connection, database.Expense.__table__, {
+        "ix_expenses_user_timestamp",
+        "ix_expenses_user_merchant_timestamp"
+    })
+    _create_indexes(connection, database.Transaction.__table__, {
+        "ix_transactions_receiver_status_timestamp",
+        "ix_transactions_sender_status_timestamp"
+    })
+    _create_indexes(connection, database.FinancialNudge.__table__, {"ix_financial_nudges_user_type_delivered"})
+    _create_indexes(connection, database.UserSpendLimit.__table__, {"ix_user_spend_limits_user_category"})
+
+
+def _unique_spend_limits(connection):
+    # save_user_limits always replaced a user's rows, but keep the newest row
+    # per (user, category) in case a concurrent save left duplicates
+    connection.execute(text("""
+        DELETE FROM user_spend_limits
+        WHERE id NOT IN (SELECT MAX(id) FROM user_spend_limits GROUP BY user_id, category)
+    """))
+    _create_indexes(connection, database.UserSpendLimit.__table__, {"uq_user_spend_limits_user_category"})
+    # Superseded by the unique index (same columns)
+    connection.execute(text("DROP INDEX IF EXISTS ix_user_spend_limits_user_category"))
+
+
+def _post_payment_job_lease(connection):
+    columns = {column["name"] for column in inspect(connection).get_columns("post_payment_jobs")}
+    if "claimed_at" not in columns:
+        connection.execute(text("ALTER TABLE post_payment_jobs ADD COLUMN claimed_at TIMESTAMP"))
+    if "claimed_by" not in columns:
+        connection.execute(text("ALTER TABLE post_payment_jobs ADD COLUMN claimed_by VARCHAR"))
+
+
+# Expenses whose transaction already has an expense with a lower id
+_DUPLICATE_EXPENSES = """
+    FROM expenses
+    WHERE transaction_id IS NOT NULL
+      AND id NOT IN (SELECT MIN(id) FROM expenses WHERE transaction_id IS NOT NULL GROUP BY transaction_id)
+"""
+
+
+def _unique_expense_transaction(connection):
+    indexes = {index["name"]: index for index in inspect(connection).get_indexes("expenses")}
+    if indexes.get("ix_expenses_transaction_id", {}).get("unique"):
+        return
+
+    # Re-queued post-payment jobs could write a second Expense for one
+    # transaction. Deleting financial rows is left to an explicit command.
+    duplicates = connection.execute(text(f"SELECT COUNT(*) {_DUPLICATE_EXPENSES}")).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f"{duplicates} expenses repeat another expense's transaction_id, so expenses.transaction_id "
+            "cannot be made unique. Review them, then run python -m backend.migrations dedupe-expenses"
+        )
+
+    connection.execute(text("DROP INDEX IF EXISTS ix_expenses_transaction_id"))
+    _create_indexes(connection, database.Expense.__table__, {"ix_expenses_transaction_id"})
+
+
+def _link_legacy_expenses(connection):
+    # One-shot data migration: expenses written before Expense.transaction_id
+    # existed. python -m backend.utils.transaction_history backfill reruns it.
+    from sqlalchemy.orm import Session
+    from backend.utils.transaction_history import match_legacy_expenses
+
+    with Session(bind=connection) as db:
+        linked = match_legacy_expenses(db)
+    if linked:
+        logger.info(f"Linked {linked} legacy expenses to their transactions")
+
+
+# (version, name, step) in order; never renumber or edit an applied step
+MIGRATIONS = [
+    (1, "expense_transaction_link", _expense_transaction_link),
+    (2, "hot_query_indexes", _hot_query_indexes),
+    (3, "unique_spend_limits", _unique_spend_limits),
+    (4, "post_payment_job_lease", _post_payment_job_lease),
+    (5, "unique_expense_transaction", _unique_expense_transaction),
+    (6, "link_legacy_expenses", _link_legacy_expenses),
+]
+
+
+def applied_versions(db) -> set:
+    return {version for (version,) in db.query(database.SchemaVersion.version).all()}
+
+
+def upgrade() -> list:
+    """Apply pending migrations in one transaction. Returns the names applied."""
+    applied = []
+    with database.SessionLocal() as db:
+        try:
+            database.begin_write(db)
+            connection = db.connection()
+            if connection.dialect.name == "postgresql":
+                connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+
+            done = applied_versions(db)
+            for version, name, step in MIGRATIONS:
+                if version in done:
+                    continue
+                step(connection)
+                db.add(database.SchemaVersion(version=version, name=name, applied_at=datetime.utcnow()))
+                applied.append(name)
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    if applied:
+        logger.info(f"Applied schema migrations: {', '.join(applied)}")
+    return applied
+
+
+def dedupe_expenses() -> int:
+    """
+    Keep the first expense per transaction and delete the rest (migration 5's
+    precondition). Post-payment jobs are pointed at the kept expense and the
+    rollups derived from expenses are recomputed in the same transaction, so
+    they never disagree with the expenses. Returns the number deleted.
+    """
+    from backend.utils.category_spend import recompute_category_spend
+    from backend.utils.daily_spend import recompute_daily_spend
+    from backend.utils.data_version import bump_data_versions
+    from backend.utils.recurrence import recompute_recurrence
+
+    with database.SessionLocal() as db:
+        try:
+            database.begin_write(db)
+            user_ids = db.execute(text(f"SELECT DISTINCT user_id {_DUPLICATE_EXPENSES}")).scalars().all()
+            if not user_ids:
+                db.rollback()
+                return 0
+
+            db.execute(text("""
+                UPDATE post_payment_jobs
+                SET expense_id = (SELECT MIN(e.id) FROM expenses e WHERE e.transaction_id = post_payment_jobs.transaction_id)
+                WHERE expense_id IS NOT NULL
+            """))
+            removed = db.execute(text(f"DELETE {_DUPLICATE_EXPENSES}")).rowcount
+
+            recompute_daily_spend(db)
+            recompute_category_spend(db)
+            recompute_recurrence(db)
+            bump_data_versions(db, user_ids)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+    logger.info(f"Removed {removed} duplicate expenses of {len(user_ids)} users and recomputed the spend rollups")
+    return removed
+
+
+def status() -> list:
+    """(version, name, applied) for every known migration."""
+    database.SchemaVersion.__table__.create(database.engine, checkfirst=True)
+    with database.SessionLocal() as db:
+        done = applied_versions(db)
+    return [(version, name, version in done) for version, name, _ in MIGRATIONS]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Database schema migrations")
+    parser.add_argument("command", choices=["upgrade", "status", "dedupe-expenses"])
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        database.Base.metadata.create_all(bind=database.engine)
+        print(f"Applied: {upgrade() or 'nothing, schema is current'}")
+    elif args.command == "dedupe-expenses":
+        database.Base.metadata.create_all(bind=database.engine)
+        print(f"Removed {dedupe_expenses()} duplicate expenses")
+        print(f"Applied: {upgrade() or 'nothing, schema is current'}")
+    else:
+        for version, name, is_applied in status():
+            print(f"{version:>4}  {'applied' if is_applied else 'pending':<8} {name}")
@@ -1,10 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
+from loguru import logger
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import re
 
 import backend.schemas.auth as schemas
 import backend.database as database
 from backend.utils.gen_wallet import generate_wallet_id
+from backend.utils.wallet_shards import get_wallet_balance
+from backend.utils.wallet_cache import invalidate_owner
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -21,6 +25,31 @@ def validate_pass(p, c):
     if not (re.search(r"[A-Za-z]", p) and re.search(r"[0-9]", p)):
         raise HTTPException(400, "Password must contain letters and numbers")
 
+WALLET_ID_ATTEMPTS = 3
+
+
+def create_wallet(db: Session, owner_type: str, owner_id: int, balance: float) -> database.Wallet:
+    # A wallet_id collision (e.g. two processes sharing WALLET_ID_WORKER) gets a fresh id
+    for attempt in range(WALLET_ID_ATTEMPTS):
+        wallet = database.Wallet(
+            wallet_id=generate_wallet_id(owner_type),
+            owner_type=owner_type,
+            owner_id=owner_id,
+            balance=balance
+        )
+        db.add(wallet)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            logger.warning(f"Wallet ID {wallet.wallet_id} already taken, retrying")
+            continue
+        db.refresh(wallet)
+        return wallet
+
+    raise HTTPException(status_code=503, detail="Could not allocate a wallet ID, please retry")
+
+
 # ================= USER AUTH =================
 
 @router.post("/user/register")
@@ -49,14 +78,7 @@ def register(
     db.commit()
     db.refresh(new_user)
 
-    wallet = database.Wallet(
-        wallet_id=generate_wallet_id("user"),
-        owner_type="user",
-        owner_id=new_user.id,
-        balance=user.initial_balance
-    )
-    db.add(wallet)
-    db.commit()
+    wallet = create_wallet(db, "user", new_user.id, user.initial_balance)
 
     return {
         "message": "User Registered Successfully",
@@ -121,6 +143,7 @@ def update_profile(
     db_user.savings_goal = profile.savings_goal
     db_user.risk_tolerance = profile.risk_tolerance
     db.commit()
+    invalidate_owner("user", user_id)
     return {"message": "Profile updated"}
 
 
@@ -152,15 +175,7 @@ def vendor_register(
     db.commit()
     db.refresh(new_vendor)
 
-    wallet = database.Wallet(
-        wallet_id=generate_wallet_id("vendor"),
-        owner_type="vendor",
-        owner_id=new_vendor.id,
-        balance=vendor.initial_balance
-    )
-    db.add(wallet)
-    db.commit()
-    db.refresh(wallet)
+    wallet = create_wallet(db, "vendor", new_vendor.id, vendor.initial_balance)
 
     return {
         "message": "Vendor registered successfully",
@@ -208,6 +223,6 @@ def get_vendor_profile(vendor_id: int, db: Session = Depends(get_db)):
         "category": vendor.category,
         "wallet": {
             "wallet_id": wallet.wallet_id if wallet else None,
-            "balance": wallet.balance if wallet else 0.0
+            "balance": get_wallet_balance(db, wallet) if wallet else 0.0
         }
     }
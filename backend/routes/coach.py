@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
 
 import backend.database as database
-from backend.utils.coach import financial_coach_chat
+from backend.utils.category_spend import get_month_spend
+from backend.utils.coach import FALLBACK_REPLY, ask_coach, build_coach_prompt, coach_stats, recent_expenses_query, save_conversation
 
 router = APIRouter(prefix="/coach", tags=["AI Financial Coach"])
 
@@ -17,26 +18,25 @@ def get_db():
 
 
 @router.post("/chat/{user_id}")
-def chat_with_coach(user_id: int, message: str, db: Session = Depends(get_db)):
+async def chat_with_coach(user_id: int, message: str, db: Session = Depends(get_db)):
+    # DB work stays on the threadpool; only the upstream call waits on the event loop
+    prompt = await run_in_threadpool(_coach_prompt, db, user_id, message)
+
+    reply = await ask_coach(prompt)
+    if reply is None:
+        return {"reply": FALLBACK_REPLY}
+
+    await run_in_threadpool(save_conversation, db, user_id, message, reply)
+    return {"reply": reply}
+
+
+def _coach_prompt(db: Session, user_id: int, message: str) -> str:
     # Get current spend (same logic as alerts endpoint)
-    expenses = db.execute(
-        text("""
-            SELECT merchant_category, SUM(amount)
-            FROM expenses
-            WHERE user_id=:user_id
-            GROUP BY merchant_category
-        """),
-        {"user_id": user_id}
-    ).fetchall()
-
-    current_spend = {row[0]: row[1] for row in expenses}
-
-    recent_tx = db.query(database.Expense)\
-                .filter(database.Expense.user_id == user_id)\
-                .order_by(database.Expense.timestamp.desc())\
-                .limit(10).all()
-
-    reply = financial_coach_chat(
+    current_spend = get_month_spend(db, user_id)
+
+    recent_tx = recent_expenses_query(db, user_id).all()
+
+    return build_coach_prompt(
         db=db,
         user_id=user_id,
         user_message=message,
@@ -44,5 +44,7 @@ def chat_with_coach(user_id: int, message: str, db: Session = Depends(get_db)):
         recent_transactions=recent_tx
     )
 
-    return {"reply": reply}
 
+@router.get("/stats")
+def coach_upstream_stats():
+    return coach_stats()
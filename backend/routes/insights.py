@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from datetime import datetime, time
 
 import backend.database as database
-from backend.utils.gen_insights import generate_insights
+from backend.utils.insights_cache import get_insights_payload, insights_cache
 from backend.schemas.insights import SpendingInsightsResponse, InsightsForm
 
 router = APIRouter(prefix="/insights", tags=["Spending Insights"])
@@ -28,10 +28,18 @@ def get_spending_insights_form(
     start_dt = datetime.combine(data.start_date, time.min)  # 00:00:00
     end_dt   = datetime.combine(data.end_date, time.max)    # 23:59:59
 
-    return generate_insights(
+    body = get_insights_payload(
         db=db,
         user_id=data.user_id,
         start_date=start_dt,
-        end_date=end_dt
+        end_date=end_dt,
+        chart_mode=data.chart_mode,
+        granularity=data.granularity
     )
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/cache/stats")
+def get_insights_cache_stats():
+    return insights_cache.stats()
 
@@ -8,7 +8,8 @@ from backend.utils.ai_nudge_engine import (
     analyze_user_behavior,
     generate_nudge,
     can_send_nudge,
-    save_nudge
+    save_nudge,
+    nudge_history_query
 )
 
 
@@ -49,9 +50,7 @@ def get_nudge_history(user_id: int, db: Session = Depends(get_db)):
     """
     Retrieve all past AI nudges for a specific user, sorted by newest first.
     """
-    nudges = db.query(database.FinancialNudge).filter(
-        database.FinancialNudge.user_id == user_id
-    ).order_by(database.FinancialNudge.delivered_at.desc()).all()
+    nudges = nudge_history_query(db, user_id).all()
     
     if not nudges:
         return []
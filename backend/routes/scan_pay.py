@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Body, Depends, Header, HTTPException
 from sqlalchemy.orm import Session
-from datetime import datetime
+from typing import List, Optional
+import os
 
 import backend.database as database
-from backend.schemas.scanpay import ScanPay, ScanPayResponse
-from backend.utils.predict_category import is_recurring_transaction, predict_expense_category
+from backend.schemas.scanpay import ScanPay, ScanPayResponse, BatchPayResponse, PaymentStatusResponse
+from backend.utils.batch_categorizer import categorizer
+from backend.utils.payments import execute_scan_pay, execute_batch_payments
+from backend.utils.post_payment import get_payment_status
+from backend.utils.wallet_cache import wallet_cache
 
 router = APIRouter(prefix="/payments", tags=["Scan & Pay"])
 
+MAX_BATCH_PAYMENTS = int(os.getenv("MAX_BATCH_PAYMENTS", "1000"))
+
 # DB Dependency
 def get_db():
     db = database.SessionLocal()
@@ -19,111 +25,45 @@ def get_db():
 @router.post("/scan-pay", response_model=ScanPayResponse)
 def scan_and_pay(
     payload: ScanPay = Depends(ScanPay.as_form),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db)
 ):
-    # 1️⃣ Fetch sender wallet
-    sender_wallet = db.query(database.Wallet).filter(
-        database.Wallet.owner_type == "user",
-        database.Wallet.owner_id == payload.user_id
-    ).first()
-
-    if not sender_wallet:
-        raise HTTPException(status_code=404, detail="User wallet not found")
-
-    # 2️⃣ Fetch vendor wallet
-    receiver_wallet = db.query(database.Wallet).filter(
-        database.Wallet.wallet_id == payload.receiver_wallet_id,
-    ).first()
-
-    if not receiver_wallet:
-        raise HTTPException(status_code=404, detail="Receiver wallet not found")
-    
-    receiver_type = receiver_wallet.owner_type   # "user" or "vendor"
-
-    # 3️⃣ Balance check
-    if payload.amount <= 0:
-        raise HTTPException(400, "Invalid amount")
-    
-    if payload.amount > sender_wallet.balance:
-        raise HTTPException(400, "Insufficient wallet balance")
-
-    # Save pre-balance for ML
-    sender_balance_pre = sender_wallet.balance
-
-    # 4️⃣ Update balances
-    sender_wallet.balance -= payload.amount
-    receiver_wallet.balance += payload.amount
-
-    # 5️⃣ Create transaction record
-    transaction = database.Transaction(
-        sender_id=payload.user_id,
-        sender_wallet_id=sender_wallet.wallet_id,
-        receiver_id=receiver_wallet.owner_id,
-        receiver_wallet_id=receiver_wallet.wallet_id,
-        receiver_type=receiver_type,
+    # Transfer, transaction record and expense record commit together;
+    # retries carrying the same Idempotency-Key replay the first response
+    return execute_scan_pay(
+        db=db,
+        user_id=payload.user_id,
+        receiver_wallet_id=payload.receiver_wallet_id,
         amount=payload.amount,
-        status="success",
-        timestamp=datetime.utcnow()
+        idempotency_key=idempotency_key
     )
 
 
-    db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
-
-    if receiver_type == "vendor":
-        receiver = db.query(database.Vendor).filter(
-            database.Vendor.id == receiver_wallet.owner_id
-        ).first()
-
-        merchant_name = receiver.business_name
-        merchant_category = receiver.category
+@router.post("/batch", response_model=BatchPayResponse)
+def batch_pay(
+    payments: List[ScanPay] = Body(...),
+    db: Session = Depends(get_db)
+):
+    if len(payments) > MAX_BATCH_PAYMENTS:
+        raise HTTPException(400, f"At most {MAX_BATCH_PAYMENTS} payments per batch")
 
-    else:  # receiver_type == "user"
-        receiver = db.query(database.User).filter(
-            database.User.id == receiver_wallet.owner_id
-        ).first()
+    return execute_batch_payments(db, payments)
 
-        merchant_name = receiver.username
-        merchant_category = "Other" 
 
-     # 7️⃣ Calculate is_recurring for both cases
-    is_recurring = is_recurring_transaction(
-        db=db,
-        user_id=payload.user_id,
-        merchant_name=merchant_name
-    )   
+@router.get("/status/{user_id}/{transaction_id}", response_model=PaymentStatusResponse)
+def payment_status(user_id: int, transaction_id: int, db: Session = Depends(get_db)):
+    # Category / urgency of a payment, "pending" until the post-payment worker has run
+    status = get_payment_status(db, user_id, transaction_id)
+    if not status:
+        raise HTTPException(404, "No expense found for this transaction")
+    return status
 
 
-    # ML prediction
-    predicted_category, predicted_urgency = predict_expense_category(
-        merchant_name=merchant_name,
-        merchant_category=merchant_category,
-        amount=payload.amount,
-        is_recurring=is_recurring,
-        user_balance_pre=sender_balance_pre,
-        timestamp=transaction.timestamp
-    )
-
-    expense = database.Expense(
-        user_id=payload.user_id,
-        merchant_name=merchant_name,
-        merchant_category=merchant_category,
-        amount=payload.amount,
-        category=predicted_category,
-        urgency=predicted_urgency,
-        timestamp=datetime.utcnow()
-    )
+@router.get("/categorizer/stats")
+def get_categorizer_stats():
+    return categorizer.stats()
 
-    db.add(expense)
-    db.commit()
-    db.refresh(expense)
 
-    return {
-        "message": "Scan & Pay successful",
-        "transaction_id": transaction.id,
-        "expense_id": expense.id,
-        "remaining_balance": sender_wallet.balance,
-        "expense_category": predicted_category,
-        "urgency": predicted_urgency
-    }
+@router.get("/wallet-cache/stats")
+def get_wallet_cache_stats():
+    return wallet_cache.stats()
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import pandas as pd
 from sqlalchemy import text
 from datetime import datetime
 
-from backend.utils.spend_limit import generate_spend_limits, save_user_limits, check_spend_alerts, get_month_range
+from backend.utils.spend_limit import generate_spend_limits, save_user_limits, check_spend_alerts, get_month_range, get_user_limits, month_expenses_query
+from backend.utils.category_spend import get_month_spend
+from backend.utils.spend_alerts import alert_broker, alert_events
 import backend.database as database
 
 router = APIRouter(prefix="/spend", tags=["Spend Limits"])
@@ -22,20 +25,7 @@ def get_db():
 def generate_limits(user_id: int, db: Session = Depends(get_db)):
     month_start, next_month = get_month_range()
     # Fetch user transactions
-    expenses = db.execute(
-        text("""
-            SELECT merchant_category, amount 
-            FROM expenses 
-            WHERE user_id=:user_id
-             AND timestamp >= :month_start
-             AND timestamp < :next_month
-        """),
-        {
-            "user_id": user_id,
-            "month_start": month_start,
-            "next_month": next_month
-        }
-    ).fetchall()
+    expenses = month_expenses_query(db, user_id, month_start, next_month).all()
     
     if not expenses:
         raise HTTPException(status_code=404, detail="No expense data found")
@@ -69,60 +59,44 @@ def generate_limits(user_id: int, db: Session = Depends(get_db)):
     return {"message": "Spend limits generated successfully", "limits": limits}
 
 
+# Saved limits, served from the per-user limit cache
+@router.get("/limits/{user_id}")
+def get_limits(user_id: int, db: Session = Depends(get_db)):
+    limits = get_user_limits(db, user_id)
+    if not limits:
+        raise HTTPException(status_code=404, detail="No spend limits saved")
+    return {"limits": [limit._asdict() for limit in limits]}
+
+
 
 # Endpoint to get current month spending grouped by merchant_category.
 # Keys are normalized (title-case, stripped) to match generate_spend_limits output exactly.
 @router.get("/current-spending/{user_id}")
 def get_current_spending(user_id: int, db: Session = Depends(get_db)):
-    month_start, next_month = get_month_range()
-
-    expenses = db.execute(
-        text("""
-            SELECT merchant_category, SUM(amount) as total
-            FROM expenses
-            WHERE user_id = :user_id
-            AND timestamp >= :month_start
-            AND timestamp < :next_month
-            GROUP BY merchant_category
-        """),
-        {
-            "user_id": user_id,
-            "month_start": month_start,
-            "next_month": next_month
-        }
-    ).fetchall()
-
-    # Normalize keys: strip + title-case — same as generate_spend_limits
-    spending = {
-        str(row[0]).strip().title(): float(row[1])
-        for row in expenses
-    }
-    return {"spending": spending}
+    # Running monthly counters, kept in step with every expense write
+    return {"spending": get_month_spend(db, user_id)}
 
 
 # Endpoint to check alerts
 @router.get("/alerts/{user_id}")
 def get_alerts(user_id: int, db: Session = Depends(get_db)):
-    month_start, next_month = get_month_range()
-
     # Get current spend
-    expenses = db.execute(
-        text("""
-            SELECT merchant_category, SUM(amount) as total 
-            FROM expenses 
-            WHERE user_id = :user_id 
-            AND timestamp >= :month_start
-            AND timestamp < :next_month
-            GROUP BY merchant_category
-        """),
-        {
-            "user_id": user_id,
-            "month_start": month_start,
-            "next_month": next_month
-        }
-    ).fetchall()
-
-    current_spend = {str(row[0]).strip().title(): row[1] for row in expenses}
+    current_spend = get_month_spend(db, user_id)
     
     alerts = check_spend_alerts(db, user_id, current_spend)
-    return {"alerts": alerts}
\ No newline at end of file
+    return {"alerts": alerts}
+
+
+# Live alerts: pushed when a payment crosses a threshold, instead of polling /alerts
+@router.get("/alerts/{user_id}/stream")
+async def stream_alerts(user_id: int, request: Request):
+    return StreamingResponse(
+        alert_events(user_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/alerts-stream/stats")
+def get_alert_stream_stats():
+    return alert_broker.stats()
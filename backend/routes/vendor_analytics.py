@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+import backend.database as database
+from backend.schemas.vendor_analytics import RevenueSeriesResponse, VendorSummaryResponse
+from backend.utils.vendor_analytics import get_revenue_series, get_vendor_summary
+
+router = APIRouter(prefix="/vendor-analytics", tags=["Vendor Analytics"])
+
+DEFAULT_RANGE_DAYS = 30
+
+
+def get_db():
+    db = database.SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _range(db: Session, vendor_id: int, start_date: Optional[date], end_date: Optional[date]):
+    if not db.query(database.Vendor.id).filter(database.Vendor.id == vendor_id).first():
+        raise HTTPException(status_code=404, detail="Vendor not found")
+
+    end_date = end_date or datetime.utcnow().date()
+    start_date = start_date or end_date - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if start_date > end_date:
+        raise HTTPException(400, "Invalid date range")
+
+    return datetime.combine(start_date, time.min), datetime.combine(end_date, time.max)
+
+
+@router.get("/{vendor_id}/revenue", response_model=RevenueSeriesResponse)
+def vendor_revenue(
+    vendor_id: int,
+    granularity: str = Query("day", pattern="^(hour|day|month)$"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    # Served from the rollup rows for the range, never from transactions
+    start, end = _range(db, vendor_id, start_date, end_date)
+    return {
+        "vendor_id": vendor_id,
+        "granularity": granularity,
+        "series": get_revenue_series(db, vendor_id, granularity, start, end)
+    }
+
+
+@router.get("/{vendor_id}/summary", response_model=VendorSummaryResponse)
+def vendor_summary(
+    vendor_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    top: int = Query(5, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    start, end = _range(db, vendor_id, start_date, end_date)
+    return get_vendor_summary(db, vendor_id, start, end, top)
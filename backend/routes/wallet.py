@@ -1,13 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from typing import Optional
+from datetime import date, datetime, time
+import json
+import os
 
 import backend.schemas.auth as schemas
 import backend.database as database
+from backend.utils.transaction_history import (
+    get_user_history,
+    get_vendor_history,
+    stream_user_history,
+    stream_vendor_history,
+    encode_cursor,
+    decode_cursor
+)
+from backend.utils.export import EXPORT_FORMATS, csv_chunks, parquet_chunks, parquet_available
 
 
 router = APIRouter(tags=["Transactions and wallet"])
 
+MAX_HISTORY_PAGE = int(os.getenv("MAX_HISTORY_PAGE", "500"))
+
 def get_db():
     db = database.SessionLocal()
     try:
@@ -20,137 +36,166 @@ def add_money(
     data: schemas.WalletAddMoney = Depends(schemas.WalletAddMoney.as_form),
     db: Session = Depends(get_db)
 ):
-    # Find the wallet belonging to the user
-    wallet = db.query(database.Wallet).filter(
-        database.Wallet.owner_type == "user",
-        database.Wallet.owner_id == data.user_id
-    ).first()
-
-    if not wallet:
-        raise HTTPException(status_code=404, detail="Wallet not found")
-
-    # Update balance
-    wallet.balance += data.amount
-    db.commit()
-    db.refresh(wallet)
+    # Credit in the database, like payments do: a read-modify-write here
+    # could overwrite a concurrent debit of the same wallet
+    try:
+        database.begin_write(db)
+        new_balance = db.execute(
+            update(database.Wallet)
+            .where(
+                database.Wallet.owner_type == "user",
+                database.Wallet.owner_id == data.user_id
+            )
+            .values(balance=database.Wallet.balance + data.amount)
+            .returning(database.Wallet.balance)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+
+        if new_balance is None:
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
 
     return {
         "message": f"Successfully added ₹{data.amount}",
-        "new_balance": wallet.balance
+        "new_balance": new_balance
     }
 
-@router.get("/transactions/history/vendor/{vendor_id}")
-def get_vendor_transaction_history(vendor_id: int, db: Session = Depends(get_db)):
+def _ndjson(rows_for):
+    # Streams outlive the request's DB dependency, so they own their session
+    def generate():
+        with database.SessionLocal() as db:
+            for row in rows_for(db):
+                yield json.dumps(row) + "\n"
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+def _stream_rows(rows_for, encode, media_type: str, filename: str):
+    # Same session ownership as _ndjson, with an encoder over the row iterator
+    def generate():
+        with database.SessionLocal() as db:
+            yield from encode(rows_for(db))
+    return StreamingResponse(
+        generate(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+def _set_next_cursor(response: Response, history: list, limit: Optional[int]):
+    # A full page may have more behind it; the client passes this back as `before`
+    if limit and len(history) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(history[-1])
+
+
+def _check_cursor(before: Optional[str]):
+    if before:
+        try:
+            decode_cursor(before)
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+
+
+@router.get("/transactions/history/vendor/{vendor_id}/stream")
+def stream_vendor_transaction_history(vendor_id: int, before: Optional[str] = None, db: Session = Depends(get_db)):
 
     vendor_exists = db.query(database.Vendor).filter(database.Vendor.id == vendor_id).first()
     if not vendor_exists:
         raise HTTPException(status_code=404, detail="Vendor not found")
+    _check_cursor(before)
 
-    # Only fetch incoming (received) transactions for this vendor
-    transactions = (
-        db.query(database.Transaction)
-        .filter(
-            database.Transaction.status == "success",
-            database.Transaction.receiver_id == vendor_id,
-            database.Transaction.receiver_type == "vendor"
-        )
-        .order_by(database.Transaction.timestamp.desc())
-        .all()
-    )
+    category = vendor_exists.category
+    return _ndjson(lambda stream_db: stream_vendor_history(stream_db, vendor_id, category, before))
 
-    history = []
-
-    for tx in transactions:
-        # Sender is always a User (only users can send payments)
-        sender = db.query(database.User).filter(database.User.id == tx.sender_id).first()
-        counterparty = sender.username if sender else "Unknown User"
-
-        history.append({
-            "id": tx.id,
-            "timestamp": tx.timestamp.isoformat() if tx.timestamp else None,
-            "amount": float(tx.amount),
-            "type": "Received",
-            "party_name": counterparty,
-            "party_wallet_id": tx.sender_wallet_id,
-            "category": vendor_exists.category,   # vendor's own category
-            "urgency": None,
-            "status": tx.status,
-            "is_expense": False
-        })
 
+@router.get("/transactions/history/vendor/{vendor_id}")
+def get_vendor_transaction_history(
+    vendor_id: int,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_HISTORY_PAGE),
+    before: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+
+    vendor_exists = db.query(database.Vendor).filter(database.Vendor.id == vendor_id).first()
+    if not vendor_exists:
+        raise HTTPException(status_code=404, detail="Vendor not found")
+    _check_cursor(before)
+
+    # Only incoming (received) transactions, sender names joined in the same query
+    history = get_vendor_history(db, vendor_exists, limit, before)
+    _set_next_cursor(response, history, limit)
     return history
 
 
+@router.get("/transactions/history/{user_id}/stream")
+def stream_transaction_history(user_id: int, before: Optional[str] = None, db: Session = Depends(get_db)):
+
+    user_exists = db.query(database.User).filter(database.User.id == user_id).first()
+    if not user_exists:
+        raise HTTPException(status_code=404, detail="User not found")
+    _check_cursor(before)
+
+    return _ndjson(lambda stream_db: stream_user_history(stream_db, user_id, before))
+
+
 @router.get("/transactions/history/{user_id}")
-def get_transaction_history(user_id: int, db: Session = Depends(get_db)):
+def get_transaction_history(
+    user_id: int,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_HISTORY_PAGE),
+    before: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
 
     user_exists = db.query(database.User).filter(database.User.id == user_id).first()
     if not user_exists:
         raise HTTPException(status_code=404, detail="User not found")
+    _check_cursor(before)
+
+    # Counterparties and the linked Expense come from one joined query.
+    # Without `limit` the whole history is returned, as before.
+    history = get_user_history(db, user_id, limit, before)
+    _set_next_cursor(response, history, limit)
+    return history
 
-    transactions = (
-        db.query(database.Transaction)
-        .filter(
-            database.Transaction.status == "success",
-            (
-                (database.Transaction.sender_id == user_id) |
-                ((database.Transaction.receiver_id == user_id) & (database.Transaction.receiver_type == "user"))
-            )
-        )
-        .order_by(database.Transaction.timestamp.desc())
-        .all()
-    )
 
-    history = []
-
-    for tx in transactions:
-        # Default values (original logic)
-        tx_type = "Unknown"
-        is_expense = False
-        counterparty = "Unknown"
-        category = "Other"
-        
-        expense_record = db.query(database.Expense).filter(
-            database.Expense.user_id == user_id,
-            database.Expense.amount == tx.amount
-        ).order_by(database.Expense.timestamp.desc()).first()
-        
-        expense_category = expense_record.category if expense_record else None
-        db_urgency = expense_record.urgency if expense_record else None
-
-        # ---------------- OUTGOING ----------------
-        if tx.sender_id == user_id:
-            tx_type = "Sent"
-            if tx.receiver_type == "vendor":
-                vendor = db.query(database.Vendor).filter(database.Vendor.id == tx.receiver_id).first()
-                counterparty = vendor.business_name if vendor else "Vendor"
-                category = vendor.category if vendor else "General"
-                is_expense = True
-            elif tx.receiver_type == "user":
-                receiver = db.query(database.User).filter(database.User.id == tx.receiver_id).first()
-                counterparty = receiver.username if receiver else "Other User"
-                category = "Transfer"
-
-        # ---------------- INCOMING ----------------
-        elif tx.receiver_id == user_id and tx.receiver_type == "user":
-            tx_type = "Received"
-            is_expense = False
-            category = "Other"
-            sender = db.query(database.User).filter(database.User.id == tx.sender_id).first()
-            counterparty = sender.username if sender else "External Source"
-
-        history.append({
-            "id": tx.id,
-            "timestamp": tx.timestamp.isoformat() if tx.timestamp else None,
-            "amount": float(tx.amount),
-            "type": tx_type,
-            "party_name": counterparty,
-            "party_wallet_id": tx.receiver_wallet_id if tx.sender_id == user_id else tx.sender_wallet_id,
-            "category": category, # Original Logic category
-            "expense_category": expense_category, # From Expenses Table
-            "urgency": db_urgency, # From Expenses Table
-            "status": tx.status,
-            "is_expense": is_expense
-        })
-
-    return history
\ No newline at end of file
+@router.get("/transactions/export")
+def export_transactions(
+    user_id: Optional[int] = None,
+    vendor_id: Optional[int] = None,
+    format: str = Query("csv", pattern="^(csv|parquet)$"),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    if (user_id is None) == (vendor_id is None):
+        raise HTTPException(400, "Pass exactly one of user_id or vendor_id")
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(400, "Invalid date range")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(501, "Parquet export needs pyarrow installed on the server")
+
+    start = datetime.combine(start_date, time.min) if start_date else None
+    end = datetime.combine(end_date, time.max) if end_date else None
+
+    # Same joined rows as the history endpoints, streamed chunk by chunk
+    if user_id is not None:
+        if not db.query(database.User.id).filter(database.User.id == user_id).first():
+            raise HTTPException(status_code=404, detail="User not found")
+        owner = f"user-{user_id}"
+        rows_for = lambda stream_db: stream_user_history(stream_db, user_id, start=start, end=end)
+    else:
+        vendor = db.query(database.Vendor).filter(database.Vendor.id == vendor_id).first()
+        if not vendor:
+            raise HTTPException(status_code=404, detail="Vendor not found")
+        owner = f"vendor-{vendor_id}"
+        category = vendor.category
+        rows_for = lambda stream_db: stream_vendor_history(stream_db, vendor_id, category, start=start, end=end)
+
+    media_type, extension = EXPORT_FORMATS[format]
+    encode = csv_chunks if format == "csv" else parquet_chunks
+    period = f"_{start_date or 'start'}_{end_date or 'now'}" if start_date or end_date else ""
+    return _stream_rows(rows_for, encode, media_type, f"transactions_{owner}{period}.{extension}")
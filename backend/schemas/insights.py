@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Dict
+from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel, ValidationError
 from fastapi import Form
@@ -11,30 +11,46 @@ class InsightsForm(BaseModel):
     user_id: int
     start_date: date
     end_date: date
+    chart_mode: Literal["plotly", "series"] = "plotly"
+    granularity: Literal["day", "week", "month", "auto"] = "day"
 
     @classmethod
     def as_form(
         cls,
         user_id: int = Form(...),
         start_date: str = Form(...),  # yyyy-mm-dd
-        end_date: str = Form(...)
+        end_date: str = Form(...),
+        chart_mode: str = Form("plotly"),  # "series" = raw chart data, rendered client-side
+        granularity: str = Form("day")  # trend resolution; "auto" picks by range length
     ):
         try:
             return cls(
                 user_id=user_id,
                 start_date=date.fromisoformat(start_date),
-                end_date=date.fromisoformat(end_date)
+                end_date=date.fromisoformat(end_date),
+                chart_mode=chart_mode,
+                granularity=granularity
             )
         except ValidationError as e:
             raise RequestValidationError(e.errors())
 
 
+class InsightsCharts(BaseModel):
+    days: List[str]             # period start (yyyy-mm-dd), ascending
+    daily_totals: List[float]   # total per period at trend_granularity
+    categories: List[str]
+    category_totals: List[float]
+    category_colors: List[str]  # hex colour per category
+
+
 class SpendingInsightsResponse(BaseModel):
     total_spent: float
     category_wise_spending: Dict[str, float]
     high_urgency_expenses: int
     distinct_recurring_merchants: int
     savings_warning: str
-    daily_trend_plotly: str
-    bar_chart_plotly: str  # JSON string from Plotly
-    pie_chart_plotly: str  # JSON string from Plotly
\ No newline at end of file
+    trend_granularity: str = "day"
+    daily_trend_plotly: Optional[str] = None
+    bar_chart_plotly: Optional[str] = None  # JSON string from Plotly
+    pie_chart_plotly: Optional[str] = None  # JSON string from Plotly
+    charts: Optional[InsightsCharts] = None  # chart_mode="series" only
\ No newline at end of file
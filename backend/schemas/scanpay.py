@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field, ValidationError
 from fastapi import Form
 from fastapi.exceptions import RequestValidationError
+from typing import List, Optional
 
 
 # ---------- Scan & Pay ----------
@@ -30,7 +31,35 @@ class ScanPay(BaseModel):
 class ScanPayResponse(BaseModel):
     message: str
     transaction_id: int
-    expense_id: int
+    expense_id: Optional[int] = None  # None while categorization is pending (deferred mode)
     remaining_balance: float
+    expense_category: str            # "pending" until the post-payment worker runs
+    urgency: str
+
+
+class PaymentStatusResponse(BaseModel):
+    transaction_id: int
+    status: str                      # pending / processing / done / failed
+    expense_id: Optional[int] = None
     expense_category: str
     urgency: str
+
+
+# ---------- Batch Payments ----------
+
+class BatchPayItemResult(BaseModel):
+    index: int
+    status: str                      # success / failed
+    error: Optional[str] = None
+    transaction_id: Optional[int] = None
+    expense_id: Optional[int] = None
+    remaining_balance: Optional[float] = None
+    expense_category: Optional[str] = None
+    urgency: Optional[str] = None
+
+
+class BatchPayResponse(BaseModel):
+    message: str
+    succeeded: int
+    failed: int
+    results: List[BatchPayItemResult]
@@ -0,0 +1,34 @@
+from pydantic import BaseModel
+from datetime import date, datetime
+from typing import List
+
+
+class RevenuePoint(BaseModel):
+    bucket: datetime        # start of the hour / day / month (UTC)
+    revenue: float
+    payments: int
+    average_ticket: float
+
+
+class RevenueSeriesResponse(BaseModel):
+    vendor_id: int
+    granularity: str
+    series: List[RevenuePoint]
+
+
+class TopPayer(BaseModel):
+    user_id: int
+    name: str
+    amount: float
+    payments: int
+
+
+class VendorSummaryResponse(BaseModel):
+    vendor_id: int
+    start_date: date
+    end_date: date
+    total_revenue: float
+    payments: int
+    unique_payers: int
+    average_ticket: float
+    top_payers: List[TopPayer]
@@ -5,22 +5,26 @@ from google import genai
 
 from backend.database import (
     Expense,
-    UserSpendLimit,
     FinancialNudge
 )
+from backend.utils.spend_limit import get_user_limits
 
 # ---------------- GEMINI CLIENT ----------------
 client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
 
 # ---------------- BEHAVIOR ANALYSIS (NO AI) ----------------
+def _behavior_window_query(db: Session, user_id: int, since: datetime):
+    return db.query(Expense).filter(
+        Expense.user_id == user_id,
+        Expense.timestamp >= since
+    )
+
+
 def analyze_user_behavior(user_id: int, db: Session):
     now = datetime.utcnow()
     last_hour = now - timedelta(days=7)
 
-    expenses = db.query(Expense).filter(
-        Expense.user_id == user_id,
-        Expense.timestamp >= last_hour
-    ).all()
+    expenses = _behavior_window_query(db, user_id, last_hour).all()
 
     if not expenses:
         return None
@@ -35,11 +39,11 @@ def analyze_user_behavior(user_id: int, db: Session):
             "category": discretionary[0].category
         }
 
+    # One cached read per user instead of a query per expense
+    limits = {limit.category: limit for limit in get_user_limits(db, user_id)}
+
     for exp in expenses:
-        limit = db.query(UserSpendLimit).filter(
-            UserSpendLimit.user_id == user_id,
-            UserSpendLimit.category == exp.category
-        ).first()
+        limit = limits.get(exp.category)
 
         if limit and exp.amount >= limit.alert_threshold:
             return {
@@ -94,11 +98,22 @@ Context:
 
 
 # ---------------- RATE LIMIT + STORE ----------------
-def can_send_nudge(user_id: int, nudge_type: str, db: Session):
-    last = db.query(FinancialNudge).filter(
+def _last_nudge_query(db: Session, user_id: int, nudge_type: str):
+    return db.query(FinancialNudge).filter(
         FinancialNudge.user_id == user_id,
         FinancialNudge.nudge_type == nudge_type
-    ).order_by(FinancialNudge.delivered_at.desc()).first()
+    ).order_by(FinancialNudge.delivered_at.desc()).limit(1)
+
+
+def nudge_history_query(db: Session, user_id: int):
+    """All of a user's nudges, newest first."""
+    return db.query(FinancialNudge).filter(
+        FinancialNudge.user_id == user_id
+    ).order_by(FinancialNudge.delivered_at.desc())
+
+
+def can_send_nudge(user_id: int, nudge_type: str, db: Session):
+    last = _last_nudge_query(db, user_id, nudge_type).first()
 
     if not last:
         return True
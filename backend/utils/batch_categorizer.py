@@ -0,0 +1,152 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from loguru import logger
+
+from backend.utils.predict_category import build_feature_row, predict_feature_rows
+
+# ===== Config (env overridable) =====
+BATCHING_ENABLED = os.getenv("CATEGORIZER_BATCHING", "on").lower() not in ("0", "off", "false")
+MAX_BATCH_SIZE = int(os.getenv("CATEGORIZER_MAX_BATCH_SIZE", "32"))
+MAX_WAIT_MS = float(os.getenv("CATEGORIZER_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    """
+    Collects concurrent prediction requests for a short window and runs
+    them through one vectorized predict call.
+
+    Callers block on a Future; a single daemon thread owns the model call.
+    """
+
+    def __init__(self, predict_fn, max_batch_size: int = 32, max_wait_ms: float = 5):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_batch_seen = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._predict_total = 0.0
+        self._errors = 0
+
+    def _ensure_worker(self):
+        if self._worker and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name="expense-categorizer", daemon=True)
+            self._worker.start()
+
+    def submit(self, row) -> Future:
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((row, future, time.perf_counter()))
+        return future
+
+    def predict(self, row):
+        return self.submit(row).result()
+
+    def _collect(self):
+        # Block for the first item, then gather until the batch is full or the window closes
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            waits = [started - enqueued for _, _, enqueued in batch]
+
+            try:
+                results = self.predict_fn([row for row, _, _ in batch])
+            except Exception as e:
+                logger.error(f"Categorizer batch of {len(batch)} failed: {e}")
+                with self._stats_lock:
+                    self._errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._max_batch_seen = max(self._max_batch_seen, len(batch))
+                self._wait_total += sum(waits)
+                self._wait_max = max(self._wait_max, max(waits))
+                self._predict_total += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = self._batches or 1
+            items = self._items or 1
+            return {
+                "enabled": BATCHING_ENABLED,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "batches": self._batches,
+                "items": self._items,
+                "errors": self._errors,
+                "queue_depth": self._queue.qsize(),
+                "avg_batch_size": round(self._items / batches, 2),
+                "max_batch_size_seen": self._max_batch_seen,
+                "avg_queue_wait_ms": round(self._wait_total / items * 1000, 3),
+                "max_queue_wait_ms": round(self._wait_max * 1000, 3),
+                "avg_predict_ms": round(self._predict_total / batches * 1000, 3)
+            }
+
+
+categorizer = MicroBatcher(predict_feature_rows, MAX_BATCH_SIZE, MAX_WAIT_MS)
+
+
+def categorize_expense(
+    merchant_name: str,
+    merchant_category: str,
+    amount: float,
+    is_recurring: int,
+    user_balance_pre: float,
+    timestamp: datetime
+):
+    """
+    Drop-in replacement for predict_expense_category that goes through the
+    shared micro-batcher. Returns (predicted_category, predicted_urgency).
+    """
+    row = build_feature_row(
+        merchant_name=merchant_name,
+        merchant_category=merchant_category,
+        amount=amount,
+        is_recurring=is_recurring,
+        user_balance_pre=user_balance_pre,
+        timestamp=timestamp
+    )
+
+    if not BATCHING_ENABLED:
+        return predict_feature_rows([row])[0]
+
+    return categorizer.predict(row)
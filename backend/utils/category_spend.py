@@ -0,0 +1,146 @@
+import argparse
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+import backend.database as database
+from backend.utils.spend_limit import _norm_category, get_month_range
+
+CategorySpend = database.MonthlyCategorySpend
+
+
+def month_start(timestamp: datetime) -> datetime:
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _aggregate(expenses) -> dict:
+    """(user_id, merchant_category, amount, timestamp) -> {(user_id, month, category): [amount, count]}"""
+    totals = defaultdict(lambda: [0.0, 0])
+    for user_id, merchant_category, amount, timestamp in expenses:
+        entry = totals[(user_id, month_start(timestamp), _norm_category(merchant_category))]
+        entry[0] += amount
+        entry[1] += 1
+    return totals
+
+
+def _rows(totals: dict) -> list:
+    return [
+        {"user_id": u, "month": m, "category": c, "amount": amount, "expenses": count}
+        for (u, m, c), (amount, count) in sorted(totals.items())
+    ]
+
+
+def record_category_spend(db: Session, expenses: list):
+    """
+    Add new expenses to the monthly counters inside the caller's transaction.
+
+    expenses: dicts with user_id, merchant_category, amount and timestamp.
+    """
+    rows = _rows(_aggregate(
+        (e["user_id"], e["merchant_category"], e["amount"], e["timestamp"]) for e in expenses
+    ))
+    if not rows:
+        return
+
+    stmt = database.dialect_insert(db)(CategorySpend).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "month", "category"],
+        set_={
+            "amount": CategorySpend.amount + stmt.excluded.amount,
+            "expenses": CategorySpend.expenses + stmt.excluded.expenses
+        }
+    ))
+
+
+def _month_spend_query(db: Session, user_id: int, month: datetime):
+    return db.query(CategorySpend.category, CategorySpend.amount).filter(
+        CategorySpend.user_id == user_id,
+        CategorySpend.month == month
+    )
+
+
+def get_month_spend(db: Session, user_id: int, month: datetime = None) -> dict:
+    """{normalized category: amount} for the month starting at `month` (default: current)."""
+    if month is None:
+        month, _ = get_month_range()
+    rows = _month_spend_query(db, user_id, month).all()
+    return {category: float(amount) for category, amount in rows}
+
+
+# ===== Rebuild / reconcile =====
+def _expense_totals(db: Session) -> dict:
+    expenses = db.query(
+        database.Expense.user_id,
+        database.Expense.merchant_category,
+        database.Expense.amount,
+        database.Expense.timestamp
+    ).filter(database.Expense.timestamp.isnot(None)).execution_options(stream_results=True, yield_per=5000)
+    return _aggregate(tuple(row) for row in expenses)
+
+
+def recompute_category_spend(db: Session) -> int:
+    """Replace every counter with one recomputed from expenses, inside the caller's transaction."""
+    rows = _rows(_expense_totals(db))
+
+    db.query(CategorySpend).delete()
+    if rows:
+        db.bulk_insert_mappings(CategorySpend, rows)
+    return len(rows)
+
+
+def rebuild_category_spend(db: Session) -> int:
+    """Recompute every counter from expenses. Returns the number of rows written."""
+    try:
+        database.begin_write(db)
+        written = recompute_category_spend(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return written
+
+
+def backfill_if_empty(db: Session) -> int:
+    if db.query(CategorySpend.id).first() or not db.query(database.Expense.id).first():
+        return 0
+    return rebuild_category_spend(db)
+
+
+def reconcile_category_spend(db: Session) -> list:
+    """(user_id, month, category, expenses total, counter total) for every drifted counter."""
+    expected = {key: amount for key, (amount, _) in _expense_totals(db).items()}
+    actual = {
+        (user_id, month, category): amount
+        for user_id, month, category, amount in db.query(
+            CategorySpend.user_id, CategorySpend.month, CategorySpend.category, CategorySpend.amount
+        )
+    }
+
+    return sorted(
+        (*key, round(expected.get(key, 0.0), 2), round(actual.get(key, 0.0), 2))
+        for key in expected.keys() | actual.keys()
+        if abs(expected.get(key, 0.0) - actual.get(key, 0.0)) > 0.005
+    )
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.category_spend {reconcile,rebuild}
+    parser = argparse.ArgumentParser(description="Maintain the monthly category spend counters")
+    parser.add_argument("command", choices=["reconcile", "rebuild"])
+    args = parser.parse_args()
+
+    database.init_db()
+    session = database.SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"Rebuilt {rebuild_category_spend(session)} monthly category spend rows")
+
+        drift = reconcile_category_spend(session)
+        print(f"{len(drift)} counters drifted from expenses")
+        for user_id, month, category, expected, actual in drift[:20]:
+            print(f"  user {user_id} {month:%Y-%m} {category}: expenses {expected}, counter {actual}")
+        if drift:
+            raise SystemExit(1)
+    finally:
+        session.close()
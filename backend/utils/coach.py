@@ -1,20 +1,57 @@
 from google import genai
+from google.genai import types
+import asyncio
 import os
+from loguru import logger
 from sqlalchemy.orm import Session
-from backend.database import CoachConversation
+from backend.database import CoachConversation, Expense
+from backend.utils.circuit_breaker import CircuitBreaker
 from backend.utils.spend_limit import check_spend_alerts
 
+COACH_MODEL = "gemini-3-flash-preview"
+FALLBACK_REPLY = "I'm currently unable to respond. Please try again later."
+
+# Upstream limits for coach calls
+COACH_TIMEOUT_SECONDS = float(os.getenv("COACH_TIMEOUT_SECONDS", "20"))
+COACH_QUEUE_SECONDS = float(os.getenv("COACH_QUEUE_SECONDS", "2"))  # max wait for a free slot
+COACH_MAX_CONCURRENCY = int(os.getenv("COACH_MAX_CONCURRENCY", "8"))
+
 api_key = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=api_key)
+# GEMINI_BASE_URL points the client at a local stub (see utils/gemini_stub.py)
+http_options = types.HttpOptions(base_url=os.getenv("GEMINI_BASE_URL")) if os.getenv("GEMINI_BASE_URL") else None
+# One client for the process: its async transport keeps its connections
+client = genai.Client(api_key=api_key, http_options=http_options)
+
+coach_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("COACH_BREAKER_FAILURES", "5")),
+    reset_seconds=float(os.getenv("COACH_BREAKER_RESET_SECONDS", "30"))
+)
+_slots = None  # COACH_MAX_CONCURRENCY permits, created inside the server's event loop
+_in_flight = 0  # upstream calls holding a slot (event loop only)
+
+
+def _upstream_slots() -> asyncio.Semaphore:
+    # First use runs on the serving loop; nothing awaits between check and set
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(COACH_MAX_CONCURRENCY)
+    return _slots
+
 
+def recent_expenses_query(db: Session, user_id: int, limit: int = 10):
+    """The user's latest expenses, newest first, for the coach prompt."""
+    return db.query(Expense).filter(
+        Expense.user_id == user_id
+    ).order_by(Expense.timestamp.desc()).limit(limit)
 
-def financial_coach_chat(
+
+def build_coach_prompt(
     db: Session,
     user_id: int,
     user_message: str,
     current_spend: dict,
     recent_transactions: list
-):
+) -> str:
     history_str = "\n".join([
         f"- {tx.timestamp.strftime('%d %b')}: ₹{tx.amount} at {tx.merchant_name} ({tx.category})" 
         for tx in recent_transactions
@@ -52,18 +89,10 @@ def financial_coach_chat(
     - Suggest at most 2 small improvements.
     - Ask at most ONE reflective follow-up question
     """
+    return prompt
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-3-flash-preview",
-            contents=prompt
-        )
-    except Exception as e:
-        return "I'm currently unable to respond. Please try again later."
-
-    ai_reply = response.text.strip()
 
-    # Save conversation
+def save_conversation(db: Session, user_id: int, user_message: str, ai_reply: str):
     chat = CoachConversation(
         user_id=user_id,
         user_message=user_message,
@@ -72,4 +101,65 @@ def financial_coach_chat(
     db.add(chat)
     db.commit()
 
-    return ai_reply
+
+async def ask_coach(prompt: str):
+    """
+    The model's reply, or None when the coach should fall back.
+
+    Never waits longer than COACH_QUEUE_SECONDS for one of the
+    COACH_MAX_CONCURRENCY slots plus COACH_TIMEOUT_SECONDS for the call, and
+    returns at once while the circuit breaker is open. Only upstream errors
+    and timeouts count as breaker failures; a client disconnect does not.
+    """
+    global _in_flight
+
+    if not coach_breaker.allow():
+        return None
+
+    slots = _upstream_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout=COACH_QUEUE_SECONDS)
+    except asyncio.TimeoutError:
+        # Busy, not failing: give up this call without tripping the breaker
+        coach_breaker.release()
+        logger.warning("Coach: all upstream slots busy, returning fallback")
+        return None
+    except asyncio.CancelledError:
+        coach_breaker.release()
+        raise
+
+    _in_flight += 1
+    try:
+        response = await asyncio.wait_for(
+            client.aio.models.generate_content(model=COACH_MODEL, contents=prompt),
+            timeout=COACH_TIMEOUT_SECONDS
+        )
+    except asyncio.CancelledError:
+        # The client went away: no verdict on the upstream
+        coach_breaker.release()
+        raise
+    except Exception as e:  # includes asyncio.TimeoutError
+        coach_breaker.record_failure()
+        logger.warning(f"Coach upstream call failed: {type(e).__name__}: {e}")
+        return None
+    finally:
+        _in_flight -= 1
+        slots.release()
+
+    # The upstream answered; a blocked or empty candidate is not an outage
+    coach_breaker.record_success()
+    reply = (response.text or "").strip()
+    if not reply:
+        logger.warning("Coach upstream returned no text (blocked or empty candidates)")
+        return None
+    return reply
+
+
+def coach_stats() -> dict:
+    return {
+        "breaker": coach_breaker.stats(),
+        "max_concurrency": COACH_MAX_CONCURRENCY,
+        "in_flight": _in_flight,
+        "timeout_seconds": COACH_TIMEOUT_SECONDS,
+        "queue_seconds": COACH_QUEUE_SECONDS
+    }
@@ -0,0 +1,229 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+# ===== Paths =====
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+RESOURCES_DIR = os.path.join(BASE_DIR, "resources")
+COMPILED_MODEL_PATH = os.path.join(RESOURCES_DIR, "Expense_categorization.npz")
+DATASET_PATH = os.path.join(
+    BASE_DIR, "ML model", "Expense Categorization", "dataset", "Expense_Categorization.csv"
+)
+
+FEATURE_COLUMNS = [
+    'merchant_name',
+    'merchant_category',
+    'amount',
+    'is_recurring',
+    'user_balance_pre',
+    'hour',
+    'day_of_week'
+]
+
+
+def compile_forest(model, merchant_name_encoder, merchant_category_encoder) -> dict:
+    """
+    Flatten a fitted sklearn forest (or single tree) into plain NumPy arrays.
+
+    All trees share one node table; leaves point to themselves so a fixed
+    number of descent steps (the max depth) lands every row on its leaf.
+    """
+    estimators = getattr(model, "estimators_", [model])
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for estimator in estimators:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes)
+        is_leaf = tree.children_left == -1
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+        # Same slice DecisionTreeClassifier.predict_proba returns (single output)
+        values.append(tree.value[:, 0, :len(model.classes_)])
+        roots.append(offset)
+
+        offset += n_nodes
+        max_depth = max(max_depth, tree.max_depth)
+
+    return {
+        "feature": np.concatenate(features).astype(np.int64),
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "left": np.concatenate(lefts).astype(np.int64),
+        "right": np.concatenate(rights).astype(np.int64),
+        "value": np.concatenate(values).astype(np.float64),
+        "roots": np.asarray(roots, dtype=np.int64),
+        "max_depth": np.asarray(max_depth, dtype=np.int64),
+        "classes": np.asarray(model.classes_),
+        "merchant_names": np.asarray(merchant_name_encoder.classes_, dtype=str),
+        "merchant_categories": np.asarray(merchant_category_encoder.classes_, dtype=str)
+    }
+
+
+class CompiledForest:
+    """Pandas/sklearn-free evaluator for a forest exported by compile_forest."""
+
+    def __init__(self, arrays: dict):
+        self.feature = arrays["feature"]
+        self.threshold = arrays["threshold"]
+        self.left = arrays["left"]
+        self.right = arrays["right"]
+        self.value = arrays["value"]
+        self.roots = arrays["roots"]
+        self.max_depth = int(arrays["max_depth"])
+        self.classes = arrays["classes"]
+
+        # Encoder tables: label -> code, same codes LabelEncoder.transform gives
+        self.merchant_name_codes = {str(n): i for i, n in enumerate(arrays["merchant_names"])}
+        self.merchant_category_codes = {str(c): i for i, c in enumerate(arrays["merchant_categories"])}
+
+    @classmethod
+    def load(cls, path: str = COMPILED_MODEL_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def predict_proba(self, rows) -> np.ndarray:
+        # sklearn trees compare float32 features against float64 thresholds
+        X = np.asarray(rows, dtype=np.float64).astype(np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+
+        # Flat indexing into X is much cheaper than 2-D fancy indexing
+        flat_X = X.ravel()
+        row_offsets = (np.arange(X.shape[0]) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], self.roots.shape[0])).copy()
+
+        for _ in range(self.max_depth):
+            go_left = flat_X[row_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        # Accumulate trees strictly in order (cumsum is sequential), like the forest does
+        leaf_values = self.value[nodes]
+        proba = np.cumsum(leaf_values, axis=1)[:, -1, :]
+        proba /= self.roots.shape[0]
+        return proba
+
+    def predict(self, rows) -> np.ndarray:
+        return self.classes.take(np.argmax(self.predict_proba(rows), axis=1), axis=0)
+
+
+# ===== Export / verification / benchmark =====
+def _load_sklearn_artifacts():
+    import joblib
+
+    return (
+        joblib.load(os.path.join(RESOURCES_DIR, "Expense_categorization.pkl")),
+        joblib.load(os.path.join(RESOURCES_DIR, "merchant_name_encoder.pkl")),
+        joblib.load(os.path.join(RESOURCES_DIR, "merchant_category_encoder.pkl"))
+    )
+
+
+def export_compiled_model(path: str = COMPILED_MODEL_PATH) -> str:
+    model, name_encoder, category_encoder = _load_sklearn_artifacts()
+    np.savez_compressed(path, **compile_forest(model, name_encoder, category_encoder))
+    return path
+
+
+def load_dataset_rows(compiled: CompiledForest, csv_path: str = DATASET_PATH) -> np.ndarray:
+    import pandas as pd
+
+    data = pd.read_csv(csv_path)
+    timestamps = pd.to_datetime(data["timestamp"])
+
+    return np.column_stack([
+        data["merchant_name"].map(lambda n: compiled.merchant_name_codes.get(n, 0)),
+        data["merchant_category"].map(lambda c: compiled.merchant_category_codes.get(c, 0)),
+        data["amount"],
+        data["is_recurring"].astype(int),
+        data["user_balance_pre"],
+        timestamps.dt.hour,
+        timestamps.dt.dayofweek
+    ]).astype(np.float64)
+
+
+def verify_against_sklearn(path: str = COMPILED_MODEL_PATH, csv_path: str = DATASET_PATH, chunk_size: int = 1000) -> dict:
+    """Compare compiled vs sklearn probabilities bit-for-bit on the training CSV."""
+    import pandas as pd
+
+    model, _, _ = _load_sklearn_artifacts()
+    compiled = CompiledForest.load(path)
+    rows = load_dataset_rows(compiled, csv_path)
+
+    proba_mismatches = 0
+    label_mismatches = 0
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        expected = model.predict_proba(pd.DataFrame(chunk, columns=FEATURE_COLUMNS))
+        actual = compiled.predict_proba(chunk)
+
+        proba_mismatches += int((expected != actual).any(axis=1).sum())
+        label_mismatches += int((
+            model.classes_.take(np.argmax(expected, axis=1)) != compiled.classes.take(np.argmax(actual, axis=1))
+        ).sum())
+
+    return {
+        "rows": len(rows),
+        "proba_mismatches": proba_mismatches,
+        "label_mismatches": label_mismatches
+    }
+
+
+def benchmark(path: str = COMPILED_MODEL_PATH, csv_path: str = DATASET_PATH, repeats: int = 200) -> dict:
+    """Median latency (ms) for single-row and batch predictions on both paths."""
+    import pandas as pd
+
+    model, _, _ = _load_sklearn_artifacts()
+    compiled = CompiledForest.load(path)
+    rows = load_dataset_rows(compiled, csv_path)
+
+    def timed(fn):
+        samples = []
+        for i in range(repeats):
+            started = time.perf_counter()
+            fn(i)
+            samples.append((time.perf_counter() - started) * 1000)
+        return round(float(np.median(samples)), 3)
+
+    results = {}
+    for batch_size in (1, 32, 256):
+        def batch(i):
+            start = (i * batch_size) % (len(rows) - batch_size)
+            return rows[start:start + batch_size]
+
+        results[f"sklearn_batch_{batch_size}_ms"] = timed(
+            lambda i: model.predict(pd.DataFrame(batch(i), columns=FEATURE_COLUMNS))
+        )
+        results[f"numpy_batch_{batch_size}_ms"] = timed(lambda i: compiled.predict(batch(i)))
+    return results
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.compiled_model {export,verify,benchmark}
+    parser = argparse.ArgumentParser(description="Compile the expense model into NumPy arrays")
+    parser.add_argument("command", choices=["export", "verify", "benchmark"])
+    parser.add_argument("--path", default=COMPILED_MODEL_PATH)
+    parser.add_argument("--csv", default=DATASET_PATH)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"Compiled model written to {export_compiled_model(args.path)}")
+        args.command = "verify"
+
+    if args.command == "verify":
+        report = verify_against_sklearn(args.path, args.csv)
+        print(report)
+        if report["proba_mismatches"] or report["label_mismatches"]:
+            raise SystemExit("Compiled model does not match sklearn output")
+
+    if args.command == "benchmark":
+        for name, value in benchmark(args.path, args.csv).items():
+            print(f"{name}: {value}")
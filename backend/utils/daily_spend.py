@@ -0,0 +1,177 @@
+import argparse
+from collections import defaultdict
+from datetime import date, datetime
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import backend.database as database
+
+DailySpend = database.DailySpend
+
+
+GRANULARITIES = ("day", "week", "month")
+
+
+def day_start(timestamp: datetime) -> datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _aggregate(expenses) -> list:
+    """(user_id, amount, category, urgency, timestamp) expenses -> rollup rows, one per key."""
+    totals = defaultdict(lambda: [0.0, 0])
+    for user_id, amount, category, urgency, timestamp in expenses:
+        entry = totals[(user_id, day_start(timestamp), category or "uncategorized", urgency or "")]
+        entry[0] += amount
+        entry[1] += 1
+
+    return [
+        {"user_id": u, "day": d, "category": c, "urgency": g, "amount": amount, "expenses": count}
+        for (u, d, c, g), (amount, count) in sorted(totals.items())
+    ]
+
+
+def record_daily_spend(db: Session, expenses: list):
+    """
+    Add new expenses to the rollup inside the caller's transaction.
+
+    expenses: dicts with user_id, amount, category, urgency and timestamp.
+    """
+    rows = _aggregate(
+        (e["user_id"], e["amount"], e["category"], e["urgency"], e["timestamp"]) for e in expenses
+    )
+    if not rows:
+        return
+
+    stmt = database.dialect_insert(db)(DailySpend).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "day", "category", "urgency"],
+        set_={
+            "amount": DailySpend.amount + stmt.excluded.amount,
+            "expenses": DailySpend.expenses + stmt.excluded.expenses
+        }
+    ))
+
+
+def _day_range(user_id: int, start: datetime, end: datetime) -> tuple:
+    return (
+        DailySpend.user_id == user_id,
+        DailySpend.day >= day_start(start),
+        DailySpend.day <= end
+    )
+
+
+def _breakdown_query(db: Session, user_id: int, start: datetime, end: datetime):
+    return db.query(
+        DailySpend.category, DailySpend.urgency, func.sum(DailySpend.amount), func.sum(DailySpend.expenses)
+    ).filter(*_day_range(user_id, start, end)).group_by(DailySpend.category, DailySpend.urgency)
+
+
+def get_spend_breakdown(db: Session, user_id: int, start: datetime, end: datetime) -> list:
+    """(category, urgency, amount, expenses) over the whole days from start to end."""
+    return _breakdown_query(db, user_id, start, end).all()
+
+
+def _period_column(db: Session, granularity: str):
+    """DailySpend.day truncated in the database to its day / week (Monday) / month."""
+    if granularity == "day":
+        return DailySpend.day
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(granularity, DailySpend.day)
+    if granularity == "week":
+        return func.date(DailySpend.day, "-6 days", "weekday 1")
+    return func.date(DailySpend.day, "start of month")
+
+
+def _period_totals_query(db: Session, user_id: int, start: datetime, end: datetime, granularity: str = "day"):
+    period = _period_column(db, granularity).label("period")
+    return db.query(period, func.sum(DailySpend.amount)).filter(
+        *_day_range(user_id, start, end)
+    ).group_by(period).order_by(period)
+
+
+def _as_date(value) -> date:
+    # SQLite's date() returns text, date_trunc and plain columns return datetimes
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value.date() if isinstance(value, datetime) else value
+
+
+def get_period_totals(db: Session, user_id: int, start: datetime, end: datetime, granularity: str = "day") -> list:
+    """(period start date, amount) per day / week / month with spending, oldest first."""
+    return [
+        (_as_date(period), amount)
+        for period, amount in _period_totals_query(db, user_id, start, end, granularity).all()
+    ]
+
+
+# ===== Rebuild / consistency check =====
+def recompute_daily_spend(db: Session) -> int:
+    """Replace the rollup with one recomputed from expenses, inside the caller's transaction."""
+    expenses = db.query(
+        database.Expense.user_id,
+        database.Expense.amount,
+        database.Expense.category,
+        database.Expense.urgency,
+        database.Expense.timestamp
+    ).filter(database.Expense.timestamp.isnot(None)).execution_options(stream_results=True, yield_per=5000)
+    rows = _aggregate(tuple(row) for row in expenses)
+
+    db.query(DailySpend).delete()
+    if rows:
+        db.bulk_insert_mappings(DailySpend, rows)
+    return len(rows)
+
+
+def rebuild_daily_spend(db: Session) -> int:
+    """Recompute the rollup from expenses. Returns the number of rows written."""
+    try:
+        database.begin_write(db)
+        written = recompute_daily_spend(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return written
+
+
+def backfill_if_empty(db: Session) -> int:
+    if db.query(DailySpend.id).first() or not db.query(database.Expense.id).first():
+        return 0
+    return rebuild_daily_spend(db)
+
+
+def check_daily_spend(db: Session) -> list:
+    """(user_id, expenses total, rollup total) for users whose rollup disagrees."""
+    expected = dict(db.query(database.Expense.user_id, func.sum(database.Expense.amount)).filter(
+        database.Expense.timestamp.isnot(None)
+    ).group_by(database.Expense.user_id).all())
+    actual = dict(db.query(DailySpend.user_id, func.sum(DailySpend.amount)).group_by(DailySpend.user_id).all())
+
+    return sorted(
+        (user_id, round(expected.get(user_id, 0.0), 2), round(actual.get(user_id, 0.0), 2))
+        for user_id in expected.keys() | actual.keys()
+        if abs(expected.get(user_id, 0.0) - actual.get(user_id, 0.0)) > 0.005
+    )
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.daily_spend {rebuild,check}
+    parser = argparse.ArgumentParser(description="Maintain the daily spend rollup")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    database.init_db()
+    session = database.SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"Rebuilt {rebuild_daily_spend(session)} daily spend rows")
+
+        mismatches = check_daily_spend(session)
+        print(f"{len(mismatches)} users with mismatching totals")
+        for user_id, expected, actual in mismatches[:20]:
+            print(f"  user {user_id}: expenses {expected}, rollup {actual}")
+        if mismatches:
+            raise SystemExit(1)
+    finally:
+        session.close()
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+import backend.database as database
+
+Version = database.UserDataVersion
+LimitVersion = database.UserLimitVersion
+
+
+def _bump(db: Session, model, user_ids):
+    now = datetime.utcnow()
+    rows = [{"user_id": user_id, "version": 1, "updated_at": now} for user_id in sorted(set(user_ids))]
+    if not rows:
+        return
+
+    stmt = database.dialect_insert(db)(model).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={"version": model.version + 1, "updated_at": stmt.excluded.updated_at}
+    ))
+
+
+def bump_data_versions(db: Session, user_ids):
+    """Advance each user's data version inside the caller's transaction."""
+    _bump(db, Version, user_ids)
+
+
+def get_data_version(db: Session, user_id: int) -> int:
+    version = db.query(Version.version).filter(Version.user_id == user_id).scalar()
+    return version or 0
+
+
+def bump_limit_versions(db: Session, user_ids):
+    """Advance each user's spend-limit version inside the transaction that saves the limits."""
+    _bump(db, LimitVersion, user_ids)
+
+
+def get_limit_version(db: Session, user_id: int) -> int:
+    version = db.query(LimitVersion.version).filter(LimitVersion.user_id == user_id).scalar()
+    return version or 0
@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import backend.database as database
+from backend.utils.category_spend import record_category_spend
+from backend.utils.daily_spend import record_daily_spend
+from backend.utils.data_version import bump_data_versions
+from backend.utils.predict_category import build_feature_row, predict_feature_rows
+from backend.utils.spend_alerts import detect_spend_alerts
+from backend.utils.recurrence import LOOKBACK_DAYS, record_merchant_visits, get_recurrence_state
+
+
+def record_expense_side_effects(db: Session, expenses: list):
+    """
+    Keep derived per-expense state in step with newly written Expense rows.
+    Runs inside the caller's transaction so both commit (or roll back) together.
+
+    expenses: dicts with user_id, merchant_name, merchant_category, amount,
+    category, urgency and timestamp.
+    """
+    record_merchant_visits(db, [
+        (e["user_id"], e["merchant_name"], e["timestamp"]) for e in expenses
+    ])
+    record_daily_spend(db, expenses)
+    record_category_spend(db, expenses)
+    detect_spend_alerts(db, expenses)
+    bump_data_versions(db, [e["user_id"] for e in expenses])
+
+
+def categorize_and_insert_expenses(db: Session, entries: list) -> list:
+    """
+    Categorize many expenses with one vectorized predict and bulk insert them.
+
+    entries: dicts with transaction_id, user_id, merchant_name, merchant_category,
+    amount, user_balance_pre and timestamp, in the order they happened. Earlier
+    entries count towards the recurrence of later ones, as they would one by one.
+    Returns the inserted rows (entry fields + id, category, urgency).
+    """
+    if not entries:
+        return []
+
+    recurrence = get_recurrence_state(db, {(e["user_id"], e["merchant_name"]) for e in entries})
+
+    rows = []
+    for entry in entries:
+        window_start = entry["timestamp"] - timedelta(days=LOOKBACK_DAYS)
+        seen = recurrence.setdefault((entry["user_id"], entry["merchant_name"]), [])
+        is_recurring = 1 if len(seen) > 1 and seen[1] >= window_start else 0
+        seen[:] = sorted(seen + [entry["timestamp"]], reverse=True)[:2]
+
+        rows.append(build_feature_row(
+            merchant_name=entry["merchant_name"],
+            merchant_category=entry["merchant_category"],
+            amount=entry["amount"],
+            is_recurring=is_recurring,
+            user_balance_pre=entry["user_balance_pre"],
+            timestamp=entry["timestamp"]
+        ))
+
+    expenses = [
+        {
+            "transaction_id": entry["transaction_id"],
+            "user_id": entry["user_id"],
+            "merchant_name": entry["merchant_name"],
+            "merchant_category": entry["merchant_category"],
+            "amount": entry["amount"],
+            "category": category,
+            "urgency": urgency,
+            "timestamp": entry["timestamp"]
+        }
+        for entry, (category, urgency) in zip(entries, predict_feature_rows(rows))
+    ]
+
+    expense_ids = db.scalars(
+        insert(database.Expense).returning(database.Expense.id, sort_by_parameter_order=True),
+        expenses
+    ).all()
+
+    record_expense_side_effects(db, expenses)
+
+    for expense, expense_id in zip(expenses, expense_ids):
+        expense["id"] = expense_id
+    return expenses
@@ -0,0 +1,107 @@
+import csv
+import io
+from datetime import datetime
+
+from backend.utils.transaction_history import STREAM_CHUNK_ROWS
+
+# Statement columns, in file order; vendor rows leave expense_category empty
+EXPORT_COLUMNS = [
+    "id", "timestamp", "type", "party_name", "party_wallet_id", "amount",
+    "category", "expense_category", "urgency", "status"
+]
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def _chunks(rows, size: int = STREAM_CHUNK_ROWS):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def csv_chunks(rows):
+    """Header, then one encoded block per chunk of history rows."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+
+    writer.writeheader()
+    for chunk in _chunks(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain.
+
+    tell() keeps counting across drains so the Parquet footer offsets stay right.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parquet_chunks(rows):
+    """One Parquet row group per chunk, streamed as it is written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("type", pa.string()),
+        ("party_name", pa.string()),
+        ("party_wallet_id", pa.string()),
+        ("amount", pa.float64()),
+        ("category", pa.string()),
+        ("expense_category", pa.string()),
+        ("urgency", pa.string()),
+        ("status", pa.string()),
+    ])
+
+    sink = _ChunkSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema) as writer:
+        for chunk in _chunks(rows):
+            columns = {name: [row.get(name) for row in chunk] for name in EXPORT_COLUMNS}
+            columns["timestamp"] = [datetime.fromisoformat(ts) if ts else None for ts in columns["timestamp"]]
+            writer.write_table(pa.table(columns, schema=schema))
+            yield sink.drain()
+
+    yield sink.drain()  # footer
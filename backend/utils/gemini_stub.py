@@ -0,0 +1,72 @@
+"""
+Local stand-in for the Gemini generateContent endpoint, for exercising the
+coach's timeouts, concurrency cap and circuit breaker without the real API.
+
+    python -m backend.utils.gemini_stub --port 8790 --delay 0.5
+    GEMINI_BASE_URL=http://127.0.0.1:8790 GEMINI_API_KEY=stub uvicorn backend.main:app
+
+--delay makes every reply slow, --fail answers 503 to every request and
+--empty answers like a safety-blocked prompt (a candidate without text).
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class GeminiStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible in the log
+    delay = 0.0
+    fail = False
+    empty = False
+    requests = 0
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with GeminiStubHandler._lock:
+            GeminiStubHandler.requests += 1
+
+        if not self.path.endswith(":generateContent"):
+            return self._reply(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+
+        time.sleep(self.delay)
+        if self.fail:
+            return self._reply(503, {"error": {"code": 503, "message": "stub outage", "status": "UNAVAILABLE"}})
+
+        if self.empty:
+            return self._reply(200, {"candidates": [{"finishReason": "SAFETY"}]})
+
+        prompt_chars = len(body)
+        text = f"Stub coach reply ({prompt_chars} prompt bytes). What is one expense you could pause this week?"
+        self._reply(200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]
+        })
+
+    def _reply(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        print(f"[stub {self.client_address[1]}] {format % args}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake Gemini generateContent endpoint")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before each reply")
+    parser.add_argument("--fail", action="store_true", help="answer every call with 503")
+    parser.add_argument("--empty", action="store_true", help="answer every call with a blocked, text-less candidate")
+    args = parser.parse_args()
+
+    GeminiStubHandler.delay = args.delay
+    GeminiStubHandler.fail = args.fail
+    GeminiStubHandler.empty = args.empty
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), GeminiStubHandler)
+    print(f"Gemini stub on http://127.0.0.1:{args.port} (delay {args.delay}s, fail={args.fail}, empty={args.empty})")
+    server.serve_forever()
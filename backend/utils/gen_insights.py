@@ -1,47 +1,53 @@
 # backend/utils/gen_insights.py
 from sqlalchemy.orm import Session
 from backend.database import Expense
-from backend.utils.predict_category import is_recurring_transaction
-from sqlalchemy import func
-import plotly.graph_objects as go
+from backend.utils.daily_spend import get_period_totals, get_spend_breakdown
+from backend.utils.downsample import lttb
+from backend.utils.recurrence import recurring_merchants as get_recurring_merchants
 import json
-import plotly.utils
+import os
 
-def generate_insights(db: Session, user_id: int, start_date, end_date):
-    expenses = db.query(Expense).filter(
-        Expense.user_id == user_id,
-        func.date(Expense.timestamp) >= start_date,
-        func.date(Expense.timestamp) <= end_date
-    ).order_by(Expense.timestamp.asc()).all()
+# "plotly": serialized figures (legacy dashboard); "series": raw series for client-side charts
+CHART_MODES = ("plotly", "series")
 
-    total_spent = 0.0
-    category_wise = {}
-    daily_spending = {} # New: Daily totals tracker
-    high_urgency_count = 0
-    recurring_merchants = set() 
+COLOR_MAP = {"red": "#EF4444", "orange": "#F97316", "yellow": "#EAB308"}
+DEFAULT_COLOR = "#4338CA"
 
-    for exp in expenses:
-        total_spent += exp.amount
-        
-        # Category breakdown
-        cat = exp.category or "uncategorized"
-        category_wise[cat] = category_wise.get(cat, 0) + exp.amount
+# Trend line resolution: "auto" picks by range length; LTTB caps whatever remains
+TREND_GRANULARITIES = ("day", "week", "month", "auto")
+AUTO_DAILY_MAX_DAYS = 92
+AUTO_WEEKLY_MAX_DAYS = 730
+MAX_TREND_POINTS = int(os.getenv("INSIGHTS_MAX_TREND_POINTS", "366"))
 
-        # New: Daily spending calculation
-        date_str = exp.timestamp.date().isoformat()
-        daily_spending[date_str] = daily_spending.get(date_str, 0) + exp.amount
 
-        if exp.urgency and exp.urgency.lower() == "critical":
-            high_urgency_count += 1
-        if is_recurring_transaction(db, user_id, exp.merchant_name):
-            recurring_merchants.add(exp.merchant_name)
+def resolve_granularity(granularity: str, start_date, end_date) -> str:
+    if granularity != "auto":
+        return granularity
+    span = (end_date - start_date).days
+    if span <= AUTO_DAILY_MAX_DAYS:
+        return "day"
+    if span <= AUTO_WEEKLY_MAX_DAYS:
+        return "week"
+    return "month"
 
-    # --- 1. DAILY SPENDING LINE CHART ---
-    sorted_days = sorted(daily_spending.keys())
-    sorted_vals = [daily_spending[d] for d in sorted_days]
 
+def _trend(period_totals: list) -> tuple:
+    """Ascending (period, total) rows -> (period labels, totals), at most MAX_TREND_POINTS."""
+    labels = [period for period, _ in period_totals]
+    totals = [total for _, total in period_totals]
+    kept = lttb([label.toordinal() for label in labels], totals, MAX_TREND_POINTS)
+    return [labels[i].isoformat() for i in kept], [round(totals[i], 2) for i in kept]
+
+
+def _plotly_figures(charts: dict) -> dict:
+    """The three dashboard figures as Plotly JSON strings, built from the series."""
+    # Plotly is heavy to import and only needed for this mode
+    import plotly.graph_objects as go
+    import plotly.utils
+
+    # --- 1. DAILY SPENDING LINE CHART ---
     fig_line = go.Figure(data=[go.Scatter(
-        x=sorted_days, y=sorted_vals,
+        x=charts["days"], y=charts["daily_totals"],
         mode='lines+markers',
         line=dict(color='#4338CA', width=3),
         marker=dict(size=6, color='#6366F1'),
@@ -56,24 +62,207 @@ def generate_insights(db: Session, user_id: int, start_date, end_date):
     )
 
     # --- 2. CATEGORY BAR CHART ---
-    color_map = {"red": "#EF4444", "orange": "#F97316", "yellow": "#EAB308"}
-    cats = list(category_wise.keys())
-    bar_colors = [color_map.get(c, "#4338CA") for c in cats]
+    cats = charts["categories"]
+    bar_colors = charts["category_colors"]
 
-    fig_bar = go.Figure(data=[go.Bar(x=cats, y=list(category_wise.values()), marker_color=bar_colors)])
+    fig_bar = go.Figure(data=[go.Bar(x=cats, y=charts["category_totals"], marker_color=bar_colors)])
     fig_bar.update_layout(height=250, margin=dict(l=20, r=20, t=10, b=20), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
 
     # --- 3. DONUT CHART ---
-    fig_pie = go.Figure(data=[go.Pie(labels=cats, values=list(category_wise.values()), hole=.6, marker=dict(colors=bar_colors))])
+    fig_pie = go.Figure(data=[go.Pie(labels=cats, values=charts["category_totals"], hole=.6, marker=dict(colors=bar_colors))])
     fig_pie.update_layout(height=250, margin=dict(l=10, r=10, t=10, b=10), paper_bgcolor='rgba(0,0,0,0)')
 
     return {
+        "daily_trend_plotly": json.dumps(fig_line, cls=plotly.utils.PlotlyJSONEncoder),
+        "bar_chart_plotly": json.dumps(fig_bar, cls=plotly.utils.PlotlyJSONEncoder),
+        "pie_chart_plotly": json.dumps(fig_pie, cls=plotly.utils.PlotlyJSONEncoder)
+    }
+
+
+def generate_insights(db: Session, user_id: int, start_date, end_date, chart_mode: str = "plotly",
+                      granularity: str = "day"):
+    # Summed in the database from the daily rollup: k + days rows, however many expenses
+    total_spent = 0.0
+    category_wise = {}
+    high_urgency_count = 0
+
+    for cat, urgency, amount, count in get_spend_breakdown(db, user_id, start_date, end_date):
+        total_spent += amount
+        
+        # Category breakdown
+        category_wise[cat] = category_wise.get(cat, 0) + amount
+
+        if urgency.lower() == "critical":
+            high_urgency_count += count
+
+    # Recurring merchants (is_recurring_transaction) the user paid within the range
+    recurring_merchants = get_recurring_merchants(db, user_id, start=start_date, end=end_date)
+
+    # Spending trend, grouped per day / week / month in the database from the daily rollup
+    granularity = resolve_granularity(granularity, start_date, end_date)
+    periods, period_totals = _trend(get_period_totals(db, user_id, start_date, end_date, granularity))
+    cats = list(category_wise.keys())
+    charts = {
+        "days": periods,
+        "daily_totals": period_totals,
+        "categories": cats,
+        "category_totals": [round(category_wise[c], 2) for c in cats],
+        "category_colors": [COLOR_MAP.get(c, DEFAULT_COLOR) for c in cats]
+    }
+
+    result = {
         "total_spent": round(total_spent, 2),
         "category_wise_spending": category_wise,
         "high_urgency_expenses": high_urgency_count,
         "distinct_recurring_merchants": len(recurring_merchants),
         "savings_warning": "High urgency detected!" if high_urgency_count > 3 else "Spending okay.",
-        "daily_trend_plotly": json.dumps(fig_line, cls=plotly.utils.PlotlyJSONEncoder),
-        "bar_chart_plotly": json.dumps(fig_bar, cls=plotly.utils.PlotlyJSONEncoder),
-        "pie_chart_plotly": json.dumps(fig_pie, cls=plotly.utils.PlotlyJSONEncoder)
-    }
\ No newline at end of file
+        "trend_granularity": granularity,
+    }
+    if chart_mode == "series":
+        result["charts"] = charts
+    else:
+        result.update(_plotly_figures(charts))
+    return result
+
+# ===== Query-count regression benchmark =====
+def benchmark(sizes=(100, 500, 2000)):
+    """Queries per generate_insights call must not grow with the number of expenses."""
+    import random
+    import time
+    from datetime import datetime, timedelta
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    import backend.database as database
+    from backend.utils.daily_spend import rebuild_daily_spend
+    from backend.utils.recurrence import is_recurring, rebuild_recurrence
+
+    engine = create_engine("sqlite://")
+    database.Base.metadata.create_all(engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(1))
+
+    random.seed(7)
+    now = datetime.utcnow()
+    counts = set()
+    with sessionmaker(bind=engine)() as db:
+        for user_id, size in enumerate(sizes, start=1):
+            db.bulk_insert_mappings(Expense, [
+                {
+                    "user_id": user_id,
+                    "merchant_name": f"Merchant {random.randrange(size // 10 + 5)}",
+                    "merchant_category": "Dining",
+                    "amount": random.uniform(50, 500),
+                    "category": random.choice(["red", "orange", "yellow"]),
+                    "urgency": random.choice(["critical", "necessary", "discretionary"]),
+                    "timestamp": now - timedelta(days=random.uniform(0, 90))
+                }
+                for _ in range(size)
+            ])
+            db.commit()
+            rebuild_recurrence(db)
+            rebuild_daily_spend(db)
+
+            statements.clear()
+            started = time.perf_counter()
+            result = generate_insights(db, user_id, now - timedelta(days=90), now)
+            elapsed = (time.perf_counter() - started) * 1000
+            queries = len(statements)
+            counts.add(queries)
+
+            merchants = {name for (name,) in db.query(Expense.merchant_name).filter(Expense.user_id == user_id).distinct()}
+            legacy = sum(is_recurring(db, user_id, name) for name in merchants)
+            scanned = sum(amount for (amount,) in db.query(Expense.amount).filter(Expense.user_id == user_id))
+            print(
+                f"{size:>5} expenses: {queries} queries, {elapsed:.0f} ms, "
+                f"{result['distinct_recurring_merchants']} recurring merchants (per-merchant check: {legacy}), "
+                f"total {result['total_spent']} (expenses: {round(scanned, 2)})"
+            )
+
+    if len(counts) > 1:
+        raise SystemExit(f"Query count varies with input size: {sorted(counts)}")
+
+
+def _rollup_session(days: int):
+    """In-memory session holding `days` of daily_spend rows for user 1."""
+    import random
+    from datetime import datetime, timedelta
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    import backend.database as database
+
+    engine = create_engine("sqlite://")
+    database.Base.metadata.create_all(engine)
+
+    random.seed(7)
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    db = sessionmaker(bind=engine)()
+    db.bulk_insert_mappings(database.DailySpend, [
+        {"user_id": 1, "day": today - timedelta(days=d), "category": category, "urgency": urgency,
+         "amount": random.uniform(50, 500), "expenses": random.randint(1, 3)}
+        for d in range(days)
+        for category in ("red", "orange", "yellow")
+        for urgency in ("critical", "necessary", "discretionary")
+    ])
+    db.commit()
+    return db, today
+
+
+def _time_insights(db, start, end, runs: int, **options) -> tuple:
+    """(first call ms, median ms, encoded response) for generate_insights + serialization."""
+    import statistics
+    import time
+    from backend.schemas.insights import SpendingInsightsResponse
+
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = generate_insights(db, 1, start, end, **options)
+        body = SpendingInsightsResponse(**result).model_dump_json(exclude_none=True).encode("utf-8")
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings[0], statistics.median(timings), result, body
+
+
+def benchmark_chart_modes(days: int = 365, runs: int = 20):
+    """Latency and response size per chart_mode for one user with `days` of spending."""
+    import sys
+    from datetime import timedelta
+
+    db, today = _rollup_session(days)
+    with db:
+        for chart_mode in ("series", "plotly"):
+            plotly_loaded = "plotly" in sys.modules
+            first, median, _, body = _time_insights(
+                db, today - timedelta(days=days), today, runs, chart_mode=chart_mode
+            )
+            print(
+                f"{chart_mode:>6}: first call {first:.1f} ms, median {median:.1f} ms, {len(body):,} bytes"
+                f"{'' if plotly_loaded else ' (plotly not imported before this mode)'}"
+            )
+
+
+def benchmark_ranges(spans=(30, 365, 1825, 3650), runs: int = 10):
+    """Trend points, response size and latency as the range grows, per granularity."""
+    from datetime import timedelta
+
+    db, today = _rollup_session(max(spans))
+    with db:
+        for span in spans:
+            for granularity in ("day", "auto"):
+                for chart_mode in ("series", "plotly"):
+                    _, median, result, body = _time_insights(
+                        db, today - timedelta(days=span), today, runs,
+                        chart_mode=chart_mode, granularity=granularity
+                    )
+                    points = len(result["charts"]["days"]) if chart_mode == "series" else ""
+                    print(
+                        f"{span:>5} days  {granularity:>4} -> {result['trend_granularity']:<5} {chart_mode:>6}: "
+                        f"{median:6.1f} ms, {len(body):>8,} bytes"
+                        f"{f', {points} trend points' if points else ''}"
+                    )
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.gen_insights
+    benchmark_chart_modes()
+    benchmark_ranges()
+    benchmark()
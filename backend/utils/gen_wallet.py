@@ -1,6 +1,181 @@
-import random
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+import backend.database as database
+
+# ===== Snowflake-style wallet IDs =====
+# 41 bits ms since EPOCH | 10 bits worker | 12 bits per-ms sequence
+# -> Crockford base32 (13 chars) + 1 Luhn mod-32 check character.
+# Unique across processes as long as no two live processes share a worker id:
+# either set a distinct WALLET_ID_WORKER per process, or leave it unset and
+# each process leases a free id from the wallet_id_workers table.
+EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford base32 (no I, L, O, U)
+BODY_LENGTH = 13
+
+
+# A leased worker id is renewed once less than half of the lease is left, so
+# server clocks may disagree by up to half the lease without two holders
+WORKER_LEASE_SECONDS = float(os.getenv("WALLET_ID_WORKER_LEASE_SECONDS", "600"))
+
+
+def lease_worker_id(owner: str, current: int = None) -> int:
+    """
+    Renew `owner`'s lease on `current`, or lease a worker id nobody holds.
+
+    A row's id is free once its expires_at has passed; claiming it is a
+    conditional UPDATE (or an INSERT for ids never used), so two processes
+    racing for the same id cannot both win.
+    """
+    Lease = database.WalletIdWorker
+    with database.SessionLocal() as db:
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=WORKER_LEASE_SECONDS)
+
+        if current is not None:
+            renewed = db.execute(
+                update(Lease).where(Lease.worker_id == current, Lease.owner == owner).values(expires_at=expires_at)
+            ).rowcount
+            db.commit()
+            if renewed:
+                return current
+
+        held = {worker_id for worker_id, in db.query(Lease.worker_id).filter(Lease.expires_at >= now)}
+        start = zlib.crc32(owner.encode()) & MAX_WORKER  # spread first picks over the id space
+        for offset in range(MAX_WORKER + 1):
+            worker_id = (start + offset) & MAX_WORKER
+            if worker_id in held:
+                continue
+
+            claimed = db.execute(
+                update(Lease).where(Lease.worker_id == worker_id, Lease.expires_at < now)
+                .values(owner=owner, expires_at=expires_at)
+            ).rowcount
+            if not claimed:
+                try:
+                    with db.begin_nested():
+                        db.add(Lease(worker_id=worker_id, owner=owner, expires_at=expires_at))
+                except IntegrityError:
+                    continue  # another process took it first
+            db.commit()
+            return worker_id
+
+    raise RuntimeError(f"All {MAX_WORKER + 1} wallet ID worker ids are leased")
+
+
+class WalletIdAllocator:
+    def __init__(self, worker_id: int = None):
+        """worker_id fixes the id; None leases one from the database on first use."""
+        if worker_id is not None and not 0 <= worker_id <= MAX_WORKER:
+            raise ValueError(f"worker_id must be between 0 and {MAX_WORKER}")
+        self.worker_id = worker_id
+        self._leased = worker_id is None
+        self._lease_pid = None
+        self._lease_renew_at = 0.0
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _ensure_lease(self):
+        if self._lease_pid != os.getpid():
+            # New process (or forked after import): never reuse the parent's lease
+            self.worker_id = None
+            self._lease_pid = os.getpid()
+            self._owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        elif time.monotonic() < self._lease_renew_at:
+            return
+
+        started = time.monotonic()
+        self.worker_id = lease_worker_id(self._owner, self.worker_id)
+        self._lease_renew_at = started + WORKER_LEASE_SECONDS / 2
+
+    def next_id(self) -> int:
+        with self._lock:
+            if self._leased:
+                self._ensure_lease()
+
+            now_ms = int(time.time() * 1000) - EPOCH_MS
+
+            # Never go backwards (clock adjustments): keep issuing from the last ms
+            if now_ms < self._last_ms:
+                now_ms = self._last_ms
+
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # 4096 IDs used this ms: wait for the next one
+                    while now_ms <= self._last_ms:
+                        now_ms = int(time.time() * 1000) - EPOCH_MS
+            else:
+                self._sequence = 0
+
+            self._last_ms = now_ms
+            return (now_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+
+def _encode(value: int) -> str:
+    chars = []
+    for _ in range(BODY_LENGTH):
+        value, digit = divmod(value, 32)
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def _check_char(body: str) -> str:
+    # Luhn mod N over the base32 alphabet: catches single typos and adjacent swaps
+    total = 0
+    factor = 2
+    for char in reversed(body):
+        addend = factor * ALPHABET.index(char)
+        total += addend // 32 + addend % 32
+        factor = 1 if factor == 2 else 2
+    return ALPHABET[(32 - total % 32) % 32]
+
+
+def is_valid_wallet_id(wallet_id: str) -> bool:
+    """Checksum validation for allocator-issued IDs (legacy 4-digit IDs have none)."""
+    parts = wallet_id.split("-")
+    if len(parts) != 3 or parts[0] != "WAL" or parts[1] not in ("USR", "VND"):
+        return False
+
+    code = parts[2]
+    if len(code) != BODY_LENGTH + 1 or any(c not in ALPHABET for c in code):
+        return False
+    return _check_char(code[:-1]) == code[-1]
+
+
+allocator = WalletIdAllocator(int(os.environ["WALLET_ID_WORKER"]) if os.getenv("WALLET_ID_WORKER") else None)
+
 
 def generate_wallet_id(owner_type: str):
     prefix = "USR" if owner_type == "user" else "VND"
-    rand = random.randint(1000, 9999)
-    return f"WAL-{prefix}-{rand}"
+    body = _encode(allocator.next_id())
+    return f"WAL-{prefix}-{body}{_check_char(body)}"
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.gen_wallet [count]
+    import sys
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    if allocator.worker_id is None:
+        database.init_db()
+    started = time.perf_counter()
+    ids = {generate_wallet_id("user") for _ in range(count)}
+    elapsed = time.perf_counter() - started
+
+    print(f"{count} IDs in {elapsed:.2f}s ({count / elapsed:,.0f}/s), unique: {len(ids) == count}")
+    print(f"sample: {next(iter(ids))}, all checksums valid: {all(map(is_valid_wallet_id, ids))}")
@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import backend.database as database
+
+CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+INFLIGHT_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+
+_responses = OrderedDict()  # (user_id, key) -> (fingerprint, response)
+_inflight = {}              # (user_id, key) -> threading.Event
+_lock = threading.Lock()
+
+
+def _remember(cache_key, fingerprint: str, response: dict):
+    with _lock:
+        _responses[cache_key] = (fingerprint, response)
+        _responses.move_to_end(cache_key)
+        while len(_responses) > CACHE_SIZE:
+            _responses.popitem(last=False)
+
+
+def _replay(fingerprint: str, stored_fingerprint: str, response: dict) -> dict:
+    if stored_fingerprint != fingerprint:
+        raise HTTPException(422, "Idempotency-Key was already used for a different payment")
+    return response
+
+
+def _lookup(db: Session, cache_key):
+    with _lock:
+        cached = _responses.get(cache_key)
+        if cached:
+            _responses.move_to_end(cache_key)
+            return cached
+
+    user_id, key = cache_key
+    row = db.query(database.IdempotencyKey).filter(
+        database.IdempotencyKey.user_id == user_id,
+        database.IdempotencyKey.key == key
+    ).first()
+    if not row:
+        return None
+
+    stored = (row.request_fingerprint, json.loads(row.response))
+    _remember(cache_key, *stored)
+    return stored
+
+
+def store_response(db: Session, user_id: int, key: str, fingerprint: str, response: dict):
+    """Add the key row to the caller's open transaction so it commits with the payment."""
+    db.add(database.IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        request_fingerprint=fingerprint,
+        response=json.dumps(response)
+    ))
+
+
+def run_idempotent(db: Session, user_id: int, key: str, fingerprint: str, execute) -> dict:
+    """
+    Run execute() at most once per (user_id, key).
+
+    Replays come from the in-process LRU or the idempotency_keys table.
+    Concurrent duplicates in this process wait for the first request; a
+    duplicate committed by another worker surfaces as a unique-key conflict
+    and is answered from the stored row.
+    """
+    cache_key = (user_id, key)
+
+    while True:
+        stored = _lookup(db, cache_key)
+        if stored:
+            return _replay(fingerprint, *stored)
+
+        with _lock:
+            event = _inflight.get(cache_key)
+            if event is None:
+                _inflight[cache_key] = threading.Event()
+                break
+
+        if not event.wait(INFLIGHT_WAIT_SECONDS):
+            raise HTTPException(409, "A request with this Idempotency-Key is still in progress")
+
+    try:
+        # The previous owner may have finished between our lookup and taking the slot
+        stored = _lookup(db, cache_key)
+        if stored:
+            return _replay(fingerprint, *stored)
+
+        response = execute()
+        _remember(cache_key, fingerprint, response)
+        return response
+    except IntegrityError:
+        db.rollback()
+        stored = _lookup(db, cache_key)
+        if not stored:
+            raise
+        return _replay(fingerprint, *stored)
+    finally:
+        with _lock:
+            _inflight.pop(cache_key).set()
@@ -0,0 +1,38 @@
+import os
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from backend.schemas.insights import SpendingInsightsResponse
+from backend.utils.cache import TTLCache
+from backend.utils.data_version import get_data_version
+from backend.utils.gen_insights import generate_insights
+
+# Finished response bodies; the TTL bounds how long "recurring merchants"
+# (relative to now) can lag when no new expense arrives
+insights_cache = TTLCache(
+    max_entries=int(os.getenv("INSIGHTS_CACHE_SIZE", "1000")),
+    ttl_seconds=float(os.getenv("INSIGHTS_CACHE_TTL", "300")),
+    max_bytes=int(os.getenv("INSIGHTS_CACHE_BYTES", str(64 * 1024 * 1024)))
+)
+
+
+def get_insights_payload(db: Session, user_id: int, start_date: datetime, end_date: datetime,
+                         chart_mode: str = "plotly", granularity: str = "day") -> bytes:
+    """
+    SpendingInsightsResponse as encoded JSON, served from the cache while the
+    user's data version is unchanged.
+
+    The version is read before computing, so an expense landing mid-compute
+    only makes the entry newer than its key, never older.
+    """
+    key = (user_id, start_date, end_date, chart_mode, granularity, get_data_version(db, user_id))
+    body = insights_cache.get(key)
+    if body is None:
+        result = generate_insights(
+            db=db, user_id=user_id, start_date=start_date, end_date=end_date,
+            chart_mode=chart_mode, granularity=granularity
+        )
+        body = SpendingInsightsResponse(**result).model_dump_json(exclude_none=True).encode("utf-8")
+        insights_cache.set(key, body)
+    return body
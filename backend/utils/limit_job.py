@@ -0,0 +1,213 @@
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+from sqlalchemy.orm import Session
+
+import backend.database as database
+from backend.utils.data_version import bump_limit_versions
+from backend.utils.spend_limit import get_month_range, upsert_user_limits
+
+# Users per chunk: one expense read, one groupby and one transaction each
+LIMIT_JOB_CHUNK_USERS = int(os.getenv("LIMIT_JOB_CHUNK_USERS", "5000"))
+
+
+def compute_limits(expenses: pd.DataFrame, users: pd.DataFrame) -> list:
+    """
+    generate_spend_limits for many users at once.
+
+    expenses: user_id, merchant_category, amount (one row per expense).
+    users: income and savings_goal, indexed by user_id.
+    Returns limit rows (user_id, category, limit, alert_threshold), including
+    each user's "Total Monthly Spend", with the same values per user.
+    """
+    if expenses.empty:
+        return []
+
+    expenses = expenses.assign(
+        category=expenses["merchant_category"].astype(str).str.strip().str.title()
+    )
+    spendable = (users["income"] - users["savings_goal"]).clip(lower=0)
+
+    stats = expenses.groupby(["user_id", "category"], sort=False)["amount"].agg(["max", "mean"]).reset_index()
+    suggested = np.maximum(stats["mean"].to_numpy() * 1.5, stats["max"].to_numpy())
+    safety_cap = stats["user_id"].map(spendable).to_numpy() * 0.6
+
+    totals = expenses.groupby("user_id", sort=False)["amount"].sum()
+    total_limits = np.minimum(spendable.reindex(totals.index).to_numpy(), totals.to_numpy() * 1.2)
+
+    # generate_spend_limits rounds a numpy scalar when the suggested limit wins
+    # (numpy rounds the scaled value half-to-even) and a Python float when the
+    # cap wins; round the same way so both paths agree to the paisa
+    rows = []
+    for user_id, category, value, cap in zip(
+        stats["user_id"].tolist(), stats["category"].tolist(), suggested.tolist(), safety_cap.tolist()
+    ):
+        final_limit = float(round(cap, 2)) if cap < value else float(round(np.float64(value), 2))
+        rows.append({
+            "user_id": user_id, "category": category,
+            "limit": final_limit, "alert_threshold": float(round(final_limit * 0.85, 2))
+        })
+    for user_id, value in zip(totals.index.tolist(), total_limits.tolist()):
+        rows.append({
+            "user_id": user_id, "category": "Total Monthly Spend",
+            "limit": float(round(value, 2)), "alert_threshold": float(round(value * 0.9, 2))
+        })
+    return rows
+
+
+def _eligible_users(db: Session):
+    # Same preconditions as POST /spend/generate
+    User = database.User
+    return db.query(User.id, User.income, User.savings_goal).filter(
+        User.income > 0,
+        User.savings_goal != 0
+    )
+
+
+def _month_expenses_query(db: Session, first_id: int, last_id: int, month_start, next_month):
+    Expense = database.Expense
+    return db.query(Expense.user_id, Expense.merchant_category, Expense.amount).filter(
+        Expense.user_id >= first_id,
+        Expense.user_id <= last_id,
+        Expense.timestamp >= month_start,
+        Expense.timestamp < next_month
+    )
+
+
+def _month_expenses(db: Session, first_id: int, last_id: int, month_start, next_month) -> pd.DataFrame:
+    rows = _month_expenses_query(db, first_id, last_id, month_start, next_month).all()
+    return pd.DataFrame(rows, columns=["user_id", "merchant_category", "amount"])
+
+
+def run_limit_job(db: Session, chunk_users: int = LIMIT_JOB_CHUNK_USERS) -> dict:
+    """
+    Regenerate this month's spend limits for every eligible user.
+
+    Users are walked in id order, chunk_users at a time. Users without
+    expenses this month keep their current limits, as the endpoint would.
+    Each chunk bumps its users' limit versions in the same transaction, so
+    running API workers drop their cached limits without a restart.
+    """
+    month_start, next_month = get_month_range()
+    eligible = _eligible_users(db).count()
+    started = time.perf_counter()
+    seen = updated = written = 0
+    after_id = 0
+
+    logger.info(f"Spend limit job: {eligible} eligible users, {chunk_users} per chunk")
+    while True:
+        chunk = _eligible_users(db).filter(database.User.id > after_id).order_by(database.User.id).limit(chunk_users).all()
+        if not chunk:
+            break
+        after_id = chunk[-1].id
+        users = pd.DataFrame(chunk, columns=["user_id", "income", "savings_goal"]).set_index("user_id")
+
+        expenses = _month_expenses(db, chunk[0].id, after_id, month_start, next_month)
+        expenses = expenses[expenses["user_id"].isin(users.index)]
+        rows = compute_limits(expenses, users)
+        user_ids = sorted({row["user_id"] for row in rows})
+
+        try:
+            database.begin_write(db)
+            upsert_user_limits(db, user_ids, rows)
+            bump_limit_versions(db, user_ids)  # every server's limit cache misses from here on
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        seen += len(chunk)
+        updated += len(user_ids)
+        written += len(rows)
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Spend limit job: {seen}/{eligible} users ({seen / elapsed:,.0f} users/s), "
+            f"{updated} updated, {written} limit rows"
+        )
+
+    elapsed = time.perf_counter() - started
+    return {
+        "users": seen,
+        "users_updated": updated,
+        "limit_rows": written,
+        "seconds": round(elapsed, 2),
+        "users_per_second": round(seen / elapsed, 1) if elapsed else 0.0
+    }
+
+
+# ===== Benchmark =====
+def benchmark(users: int = 100_000, expenses_per_user: int = 10, chunk_users: int = LIMIT_JOB_CHUNK_USERS,
+              path: str = "/tmp/limit_job_benchmark.db"):
+    """Seed a throwaway SQLite file, run the job, and spot-check users against generate_spend_limits."""
+    import random
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+    from backend.utils.data_version import get_limit_version
+    from backend.utils.spend_limit import generate_spend_limits
+
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    database.Base.metadata.create_all(engine)
+
+    random.seed(7)
+    month_start, _ = get_month_range()
+    span = max((datetime.utcnow() - month_start).total_seconds(), 1)
+    categories = ["Dining", "groceries", " Travel", "Shopping", "Utilities", "Entertainment"]
+
+    seeded = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(insert(database.User), [
+            {"id": i, "username": f"user{i}", "email": f"u{i}@x.com", "phone": f"{i:010d}", "hashed_password": "x",
+             "income": random.choice([30000.0, 50000.0, 80000.0]), "savings_goal": random.choice([5000.0, 10000.0])}
+            for i in range(1, users + 1)
+        ])
+        for first in range(1, users + 1, 10_000):
+            connection.execute(insert(database.Expense), [
+                {"user_id": user_id, "merchant_name": "Shop", "merchant_category": random.choice(categories),
+                 "amount": round(random.uniform(50, 2000), 2),
+                 "timestamp": month_start + timedelta(seconds=random.uniform(0, span))}
+                for user_id in range(first, min(first + 10_000, users + 1))
+                for _ in range(random.randint(1, 2 * expenses_per_user - 1))
+            ])
+    print(f"Seeded {users:,} users in {time.perf_counter() - seeded:.1f} s")
+
+    with sessionmaker(bind=engine)() as db:
+        result = run_limit_job(db, chunk_users)
+        print(result)
+
+        mismatches = 0
+        for user_id in random.sample(range(1, users + 1), min(200, users)):
+            user = db.get(database.User, user_id)
+            df = _month_expenses(db, user_id, user_id, *get_month_range())
+            expected = {
+                (row["category"], row["limit"], row["alert_threshold"])
+                for row in generate_spend_limits(df, user.income, user.savings_goal)
+            }
+            actual = set(db.query(
+                database.UserSpendLimit.category, database.UserSpendLimit.limit, database.UserSpendLimit.alert_threshold
+            ).filter(database.UserSpendLimit.user_id == user_id).all())
+            mismatches += expected != actual or get_limit_version(db, user_id) != 1
+        print(f"Spot check: {mismatches} of {min(200, users)} users differ from generate_spend_limits or kept their limit version")
+        if mismatches:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.limit_job [--chunk-users N] [--benchmark USERS]
+    parser = argparse.ArgumentParser(description="Regenerate this month's spend limits for every user")
+    parser.add_argument("--chunk-users", type=int, default=LIMIT_JOB_CHUNK_USERS)
+    parser.add_argument("--benchmark", type=int, metavar="USERS", help="run against a seeded throwaway database")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, chunk_users=args.chunk_users)
+    else:
+        database.init_db()
+        with database.SessionLocal() as session:
+            print(run_limit_job(session, args.chunk_users))
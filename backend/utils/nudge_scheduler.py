@@ -6,7 +6,9 @@ from backend.utils.ai_nudge_engine import (
     can_send_nudge,
     save_nudge
 )
+from backend.utils.wallet_shards import consolidate_wallet_shards
 from loguru import logger
+import os
 
 def run_nudges():
     logger.info("--- Nudge Engine Job Started ---")
@@ -48,5 +50,9 @@ def run_nudges():
 def start_scheduler():
     scheduler = BackgroundScheduler()
     scheduler.add_job(run_nudges, "interval", minutes=180)  ## change this
+    scheduler.add_job(
+        consolidate_wallet_shards, "interval",
+        seconds=int(os.getenv("WALLET_SHARD_CONSOLIDATE_SECONDS", "60"))
+    )
     scheduler.start()
     logger.info("Scheduler started successfully.")
\ No newline at end of file
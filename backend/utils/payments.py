@@ -0,0 +1,504 @@
+from fastapi import HTTPException
+from sqlalchemy import or_, and_, not_, update, insert, bindparam
+from sqlalchemy.orm import Session
+from datetime import datetime
+import time
+
+import backend.database as database
+from backend.utils.predict_category import is_recurring_transaction
+from backend.utils.batch_categorizer import categorize_expense
+from backend.utils.wallet_shards import is_sharded, sharded_clause, credit_shard
+from backend.utils.idempotency import run_idempotent, store_response
+from backend.utils.expenses import categorize_and_insert_expenses, record_expense_side_effects
+from backend.utils.post_payment import is_deferred, notify_worker
+from backend.utils.vendor_analytics import record_vendor_payments
+from backend.utils.wallet_cache import resolve_wallet, resolve_user_wallet
+
+
+def apply_transfer(db: Session, sender_wallet, receiver_wallet, amount: float):
+    """
+    Move money with guarded in-database arithmetic, never read-modify-write.
+
+    The debit only matches while balance >= amount, so two concurrent payments
+    cannot overdraw or lose an update. Rows are touched in id order so
+    opposite-direction payments cannot deadlock on row locks. Sharded vendor
+    wallets are credited on a sub-balance row and never locked here.
+    Returns the sender's new balance, or None (caller rolls back) when the
+    balance is insufficient.
+    """
+    debit = (
+        update(database.Wallet)
+        .where(database.Wallet.id == sender_wallet.id, database.Wallet.balance >= amount)
+        .values(balance=database.Wallet.balance - amount)
+        .returning(database.Wallet.balance)
+        .execution_options(synchronize_session=False)
+    )
+    credit = (
+        update(database.Wallet)
+        .where(database.Wallet.id == receiver_wallet.id)
+        .values(balance=database.Wallet.balance + amount)
+        .execution_options(synchronize_session=False)
+    )
+
+    if is_sharded(receiver_wallet):
+        balance = db.execute(debit).scalar_one_or_none()
+        if balance is not None:
+            credit_shard(db, receiver_wallet.wallet_id, amount, key=f"{sender_wallet.wallet_id}:{time.perf_counter_ns()}")
+        return balance
+
+    if sender_wallet.id > receiver_wallet.id:
+        db.execute(credit)
+        return db.execute(debit).scalar_one_or_none()
+
+    balance = db.execute(debit).scalar_one_or_none()
+    if balance is None:
+        return None
+
+    db.execute(credit)
+    if sender_wallet.id == receiver_wallet.id:
+        balance += amount  # paying your own wallet
+    return balance
+
+
+def _record_transaction(db: Session, user_id: int, sender_wallet, receiver_wallet, amount: float, now: datetime):
+    """Insert the successful Transaction and fold it into the vendor revenue rollups."""
+    transaction = database.Transaction(
+        sender_id=user_id,
+        sender_wallet_id=sender_wallet.wallet_id,
+        receiver_id=receiver_wallet.owner_id,
+        receiver_wallet_id=receiver_wallet.wallet_id,
+        receiver_type=receiver_wallet.owner_type,
+        amount=amount,
+        status="success",
+        timestamp=now
+    )
+    db.add(transaction)
+    db.flush()
+
+    if receiver_wallet.owner_type == "vendor":
+        record_vendor_payments(db, [(receiver_wallet.owner_id, user_id, amount, now)])
+    return transaction
+
+
+def execute_scan_pay(
+    db: Session,
+    user_id: int,
+    receiver_wallet_id: str,
+    amount: float,
+    idempotency_key: str = None
+) -> dict:
+    """
+    Scan & Pay as one atomic unit: balances, Transaction and Expense are
+    written together and committed once. In deferred mode only the transfer
+    and Transaction commit here; the Expense follows from the post-payment worker.
+
+    With an idempotency_key, a retried request returns the first response
+    without touching wallets or the model.
+    """
+    if not idempotency_key:
+        return _scan_pay(db, user_id, receiver_wallet_id, amount)
+
+    fingerprint = f"{receiver_wallet_id}|{amount}"
+    return run_idempotent(
+        db, user_id, idempotency_key, fingerprint,
+        lambda: _scan_pay(db, user_id, receiver_wallet_id, amount, (idempotency_key, fingerprint))
+    )
+
+
+def _scan_pay(db: Session, user_id: int, receiver_wallet_id: str, amount: float, idempotency=None) -> dict:
+    if amount <= 0:
+        raise HTTPException(400, "Invalid amount")
+
+    # 1️⃣ Resolve sender + receiver identities (cached; balances are not)
+    sender_wallet = resolve_user_wallet(db, user_id)
+    if not sender_wallet:
+        raise HTTPException(status_code=404, detail="User wallet not found")
+
+    receiver_wallet = resolve_wallet(db, receiver_wallet_id)
+    if not receiver_wallet:
+        raise HTTPException(status_code=404, detail="Receiver wallet not found")
+
+    # Save pre-balance for ML (always read fresh)
+    sender_balance_pre = db.query(database.Wallet.balance).filter(
+        database.Wallet.id == sender_wallet.id
+    ).scalar()
+
+    if amount > sender_balance_pre:
+        raise HTTPException(400, "Insufficient wallet balance")
+
+    now = datetime.utcnow()
+    merchant_name = receiver_wallet.merchant_name
+    merchant_category = receiver_wallet.merchant_category
+
+    if is_deferred():
+        return _scan_pay_deferred(db, user_id, sender_wallet, receiver_wallet, amount, sender_balance_pre, now, idempotency)
+
+    # 2️⃣ Categorize before taking the write lock so inference never holds it
+    is_recurring = is_recurring_transaction(
+        db=db,
+        user_id=user_id,
+        merchant_name=merchant_name
+    )
+
+    predicted_category, predicted_urgency = categorize_expense(
+        merchant_name=merchant_name,
+        merchant_category=merchant_category,
+        amount=amount,
+        is_recurring=is_recurring,
+        user_balance_pre=sender_balance_pre,
+        timestamp=now
+    )
+
+    # 3️⃣ Money movement + records, single commit
+    try:
+        database.begin_write(db)
+
+        remaining_balance = apply_transfer(db, sender_wallet, receiver_wallet, amount)
+        if remaining_balance is None:
+            raise HTTPException(400, "Insufficient wallet balance")
+
+        transaction = _record_transaction(db, user_id, sender_wallet, receiver_wallet, amount, now)
+
+        expense = database.Expense(
+            transaction_id=transaction.id,
+            user_id=user_id,
+            merchant_name=merchant_name,
+            merchant_category=merchant_category,
+            amount=amount,
+            category=predicted_category,
+            urgency=predicted_urgency,
+            timestamp=now
+        )
+        db.add(expense)
+        db.flush()
+        record_expense_side_effects(db, [{
+            "user_id": user_id,
+            "merchant_name": merchant_name,
+            "merchant_category": merchant_category,
+            "amount": amount,
+            "category": predicted_category,
+            "urgency": predicted_urgency,
+            "timestamp": now
+        }])
+
+        response = {
+            "message": "Scan & Pay successful",
+            "transaction_id": transaction.id,
+            "expense_id": expense.id,
+            "remaining_balance": remaining_balance,
+            "expense_category": predicted_category,
+            "urgency": predicted_urgency
+        }
+        if idempotency:
+            store_response(db, user_id, *idempotency, response)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return response
+
+
+def _scan_pay_deferred(db: Session, user_id: int, sender_wallet, receiver_wallet, amount: float,
+                       sender_balance_pre: float, now: datetime, idempotency=None) -> dict:
+    """
+    Money movement only: the Transaction commits with a post-payment job and
+    the worker writes the categorized Expense afterwards.
+    """
+    try:
+        database.begin_write(db)
+
+        remaining_balance = apply_transfer(db, sender_wallet, receiver_wallet, amount)
+        if remaining_balance is None:
+            raise HTTPException(400, "Insufficient wallet balance")
+
+        transaction = _record_transaction(db, user_id, sender_wallet, receiver_wallet, amount, now)
+
+        db.add(database.PostPaymentJob(
+            transaction_id=transaction.id,
+            user_id=user_id,
+            merchant_name=receiver_wallet.merchant_name,
+            merchant_category=receiver_wallet.merchant_category,
+            amount=amount,
+            user_balance_pre=sender_balance_pre,
+            created_at=now
+        ))
+
+        response = {
+            "message": "Scan & Pay successful, categorization pending",
+            "transaction_id": transaction.id,
+            "expense_id": None,
+            "remaining_balance": remaining_balance,
+            "expense_category": "pending",
+            "urgency": "pending"
+        }
+        if idempotency:
+            store_response(db, user_id, *idempotency, response)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    notify_worker()
+    return response
+
+
+def execute_batch_payments(db: Session, payments: list) -> dict:
+    """
+    Many Scan & Pay items in one transaction.
+
+    Wallets are resolved and locked with one query (sharded vendor wallets
+    are read without a lock), balances are validated in
+    memory in request order, transactions are bulk inserted and every accepted
+    item is categorized by one vectorized predict. Items
+    that fail validation are reported and skipped; the rest commit together.
+    """
+    results = [{"index": i, "status": "failed"} for i in range(len(payments))]
+    if not payments:
+        return {"message": "No payments submitted", "succeeded": 0, "failed": 0, "results": []}
+
+    user_ids = {p.user_id for p in payments}
+    receiver_wallet_ids = {p.receiver_wallet_id for p in payments}
+    now = datetime.utcnow()
+
+    try:
+        database.begin_write(db)
+
+        # 1️⃣ All sender + receiver wallets in one (locked) query. Sharded
+        # vendor wallets are only credited on their shard rows, so like
+        # apply_transfer the batch never locks them.
+        receivers = database.Wallet.wallet_id.in_(receiver_wallet_ids)
+        wallets = db.query(database.Wallet).filter(or_(
+            and_(database.Wallet.owner_type == "user", database.Wallet.owner_id.in_(user_ids)),
+            and_(receivers, not_(sharded_clause()))
+        )).order_by(database.Wallet.id).with_for_update().all()
+        wallets += db.query(database.Wallet).filter(receivers, sharded_clause()).all()
+
+        sender_by_user = {w.owner_id: w for w in wallets if w.owner_type == "user"}
+        wallet_by_id = {w.wallet_id: w for w in wallets}
+
+        # 2️⃣ Receiver names/categories, one query per owner type
+        vendor_ids = {w.owner_id for w in wallet_by_id.values() if w.owner_type == "vendor"}
+        receiver_user_ids = {w.owner_id for w in wallet_by_id.values() if w.owner_type == "user"}
+        vendors = {
+            v.id: (v.business_name, v.category)
+            for v in db.query(database.Vendor).filter(database.Vendor.id.in_(vendor_ids)).all()
+        } if vendor_ids else {}
+        users = {
+            u.id: (u.username, "Other")
+            for u in db.query(database.User).filter(database.User.id.in_(receiver_user_ids)).all()
+        } if receiver_user_ids else {}
+
+        def merchant_for(wallet):
+            owners = vendors if wallet.owner_type == "vendor" else users
+            return owners.get(wallet.owner_id)
+
+        # 3️⃣ Validate in memory, in submission order
+        balances = {w.id: w.balance for w in wallets}
+        deltas = {}
+        remaining_after = {}
+        accepted = []
+
+        for i, payment in enumerate(payments):
+            sender_wallet = sender_by_user.get(payment.user_id)
+            receiver_wallet = wallet_by_id.get(payment.receiver_wallet_id)
+            merchant = merchant_for(receiver_wallet) if receiver_wallet else None
+
+            if not sender_wallet:
+                results[i]["error"] = "User wallet not found"
+                continue
+            if not receiver_wallet or not merchant:
+                results[i]["error"] = "Receiver wallet not found"
+                continue
+            if payment.amount > balances[sender_wallet.id]:
+                results[i]["error"] = "Insufficient wallet balance"
+                continue
+
+            balance_pre = balances[sender_wallet.id]
+            balances[sender_wallet.id] -= payment.amount
+            balances[receiver_wallet.id] += payment.amount
+            deltas[sender_wallet.id] = deltas.get(sender_wallet.id, 0.0) - payment.amount
+            deltas[receiver_wallet.id] = deltas.get(receiver_wallet.id, 0.0) + payment.amount
+            remaining_after[i] = balances[sender_wallet.id]
+
+            accepted.append((i, payment, sender_wallet, receiver_wallet, merchant, balance_pre))
+
+        if not accepted:
+            db.rollback()
+            return {"message": "No payments processed", "succeeded": 0, "failed": len(payments), "results": results}
+
+        # 4️⃣ Net balance deltas (sharded vendor wallets go to their sub-balances)
+        wallet_by_pk = {w.id: w for w in wallets}
+        row_deltas = []
+        for wallet_pk, delta in deltas.items():
+            wallet = wallet_by_pk[wallet_pk]
+            if is_sharded(wallet):
+                credit_shard(db, wallet.wallet_id, delta, key=f"batch:{time.perf_counter_ns()}")
+            elif delta:
+                row_deltas.append({"wallet_pk": wallet_pk, "delta": delta})
+
+        if row_deltas:
+            db.execute(
+                update(database.Wallet.__table__)
+                .where(database.Wallet.id == bindparam("wallet_pk"))
+                .values(balance=database.Wallet.balance + bindparam("delta")),
+                row_deltas
+            )
+
+        # 5️⃣ Bulk insert transactions, then categorize all expenses with one predict
+        transaction_ids = db.scalars(
+            insert(database.Transaction).returning(database.Transaction.id, sort_by_parameter_order=True),
+            [
+                {
+                    "sender_id": payment.user_id,
+                    "sender_wallet_id": sender_wallet.wallet_id,
+                    "receiver_id": receiver_wallet.owner_id,
+                    "receiver_wallet_id": receiver_wallet.wallet_id,
+                    "receiver_type": receiver_wallet.owner_type,
+                    "amount": payment.amount,
+                    "status": "success",
+                    "timestamp": now
+                }
+                for _, payment, sender_wallet, receiver_wallet, _, _ in accepted
+            ]
+        ).all()
+
+        record_vendor_payments(db, [
+            (receiver_wallet.owner_id, payment.user_id, payment.amount, now)
+            for _, payment, _, receiver_wallet, _, _ in accepted
+            if receiver_wallet.owner_type == "vendor"
+        ])
+
+        expenses = categorize_and_insert_expenses(db, [
+            {
+                "transaction_id": tx_id,
+                "user_id": payment.user_id,
+                "merchant_name": merchant[0],
+                "merchant_category": merchant[1],
+                "amount": payment.amount,
+                "user_balance_pre": balance_pre,
+                "timestamp": now
+            }
+            for (_, payment, _, _, merchant, balance_pre), tx_id in zip(accepted, transaction_ids)
+        ])
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    for (i, *_), tx_id, expense in zip(accepted, transaction_ids, expenses):
+        results[i] = {
+            "index": i,
+            "status": "success",
+            "transaction_id": tx_id,
+            "expense_id": expense["id"],
+            "remaining_balance": remaining_after[i],
+            "expense_category": expense["category"],
+            "urgency": expense["urgency"]
+        }
+
+    failed = len(payments) - len(accepted)
+    return {
+        "message": "Batch processed" if not failed else "Batch processed with failures",
+        "succeeded": len(accepted),
+        "failed": failed,
+        "results": results
+    }
+
+
+# ===== Benchmark =====
+def benchmark(payments: int = 400, threads: int = 16, users: int = 8, vendors: int = 2,
+              start_balance: float = 1000.0, path: str = "/tmp/payments_benchmark.db"):
+    """
+    Mixed Scan & Pay (user -> vendor and user -> user) from `threads` threads
+    against one small wallet set on a throwaway SQLite file.
+
+    Asserts that money is conserved and no balance goes negative, and reports
+    payments per second. Declined payments (insufficient balance) are expected:
+    start balances are low so concurrent debits of the same wallet contend.
+    """
+    import os
+    import random
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import create_engine, func
+    from sqlalchemy.orm import sessionmaker
+
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 60})
+    database.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    random.seed(7)
+
+    with Session() as db:
+        for i in range(1, users + 1):
+            db.add(database.User(id=i, username=f"user{i}", email=f"u{i}@x.com", phone=f"{i:010d}", hashed_password="x"))
+            db.add(database.Wallet(wallet_id=f"BENCH-U{i}", owner_type="user", owner_id=i, balance=start_balance))
+        for i in range(1, vendors + 1):
+            db.add(database.Vendor(id=i, business_name=f"Vendor {i}", email=f"v{i}@x.com", phone=f"9{i:09d}",
+                                   category=random.choice(["Dining", "Groceries", "Travel"]), hashed_password="x"))
+            db.add(database.Wallet(wallet_id=f"BENCH-V{i}", owner_type="vendor", owner_id=i, balance=0.0))
+        db.commit()
+
+    def total_money(db):
+        wallets = db.query(func.coalesce(func.sum(database.Wallet.balance), 0.0)).scalar()
+        shards = db.query(func.coalesce(func.sum(database.WalletBalanceShard.balance), 0.0)).scalar()
+        return round(wallets + shards, 2)
+
+    jobs = []
+    for _ in range(payments):
+        sender = random.randint(1, users)
+        if random.random() < 0.7:
+            receiver = f"BENCH-V{random.randint(1, vendors)}"
+        else:
+            receiver = f"BENCH-U{random.choice([u for u in range(1, users + 1) if u != sender] or [sender])}"
+        jobs.append((sender, receiver, random.choice([5.0, 50.0, 150.0])))
+
+    def pay(job):
+        with Session() as db:
+            try:
+                execute_scan_pay(db, *job)
+                return "ok"
+            except HTTPException as exc:
+                return f"{exc.status_code} {exc.detail}"
+
+    with Session() as db:
+        before = total_money(db)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        outcomes = Counter(pool.map(pay, jobs))
+    elapsed = time.perf_counter() - started
+
+    with Session() as db:
+        after = total_money(db)
+        negative = db.query(database.Wallet).filter(database.Wallet.balance < 0).count()
+        transactions = db.query(database.Transaction).count()
+        expenses = db.query(database.Expense).count()
+
+    print(f"{payments} payments on {threads} threads in {elapsed:.2f} s ({payments / elapsed:,.1f} payments/s)")
+    print(f"outcomes: {dict(outcomes)}, transactions: {transactions}, expenses: {expenses}")
+    print(f"total balance {before} -> {after}, negative wallets: {negative}")
+
+    assert after == before, f"money not conserved: {before} -> {after}"
+    assert negative == 0, f"{negative} wallets went negative"
+    assert transactions == outcomes["ok"], f"{outcomes['ok']} payments succeeded but {transactions} transactions exist"
+    if not is_deferred():
+        assert expenses == transactions, f"{transactions} transactions but {expenses} expenses"
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.payments bench [--payments N] [--threads N]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scan & Pay tools")
+    parser.add_argument("command", choices=["bench"])
+    parser.add_argument("--payments", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    benchmark(args.payments, args.threads)
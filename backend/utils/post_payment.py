@@ -0,0 +1,244 @@
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from loguru import logger
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+
+import backend.database as database
+from backend.utils.expenses import categorize_and_insert_expenses
+
+# ===== Config (env overridable) =====
+# sync:     Scan & Pay categorizes and writes the Expense before responding
+# deferred: the transfer commits alone; this worker writes the Expense later
+CATEGORIZATION_MODE = os.getenv("PAYMENT_CATEGORIZATION_MODE", "sync").lower()
+JOB_BATCH_SIZE = int(os.getenv("POST_PAYMENT_BATCH_SIZE", "256"))
+POLL_SECONDS = float(os.getenv("POST_PAYMENT_POLL_SECONDS", "2"))
+MAX_ATTEMPTS = int(os.getenv("POST_PAYMENT_MAX_ATTEMPTS", "3"))
+# A claimed job belongs to its worker for this long; after that any worker may take it over
+LEASE_SECONDS = float(os.getenv("POST_PAYMENT_LEASE_SECONDS", "300"))
+
+Job = database.PostPaymentJob
+
+_wakeup = threading.Event()
+_worker = None
+_start_lock = threading.Lock()
+
+
+def is_deferred() -> bool:
+    return CATEGORIZATION_MODE == "deferred"
+
+
+def notify_worker():
+    """Called after a payment commits its job row so it is picked up immediately."""
+    _wakeup.set()
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _claimable_jobs_query(db: Session, now: datetime):
+    """Pending jobs and jobs whose lease ran out, oldest first."""
+    return db.query(
+        Job.id, Job.transaction_id, Job.user_id, Job.merchant_name, Job.merchant_category,
+        Job.amount, Job.user_balance_pre, Job.created_at, Job.attempts
+    ).filter(or_(
+        Job.status == "pending",
+        and_(
+            Job.status == "processing",
+            or_(Job.claimed_at.is_(None), Job.claimed_at < now - timedelta(seconds=LEASE_SECONDS))
+        )
+    )).order_by(Job.id).limit(JOB_BATCH_SIZE)
+
+
+def _claim_jobs(db: Session) -> list:
+    """
+    Lease up to JOB_BATCH_SIZE jobs to this worker, oldest first.
+
+    Takes pending jobs and 'processing' jobs whose lease ran out (their
+    worker crashed or stalled), never jobs another live worker holds.
+    """
+    now = datetime.utcnow()
+    try:
+        database.begin_write(db)
+        query = _claimable_jobs_query(db, now)
+        if db.get_bind().dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+
+        jobs = query.all()
+        if jobs:
+            db.execute(
+                update(Job).where(Job.id.in_([job.id for job in jobs]))
+                .values(status="processing", claimed_at=now, claimed_by=worker_name())
+                .execution_options(synchronize_session=False)
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return jobs
+
+
+def _held(job_id: int):
+    """Update filter: the job is still leased to this worker."""
+    return and_(Job.id == job_id, Job.status == "processing", Job.claimed_by == worker_name())
+
+
+def _complete_jobs(db: Session, jobs: list):
+    """
+    Categorize, insert the expenses and mark the jobs done in one commit.
+
+    A job whose transaction already has an Expense (an earlier holder of an
+    expired lease finished it) is marked done with that Expense instead of
+    inserting a second one; expenses.transaction_id is unique as a backstop.
+    """
+    try:
+        database.begin_write(db)
+        existing = {
+            expense.transaction_id: {"id": expense.id, "category": expense.category, "urgency": expense.urgency}
+            for expense in db.query(
+                database.Expense.id, database.Expense.transaction_id, database.Expense.category, database.Expense.urgency
+            ).filter(database.Expense.transaction_id.in_([job.transaction_id for job in jobs]))
+        }
+        fresh = [job for job in jobs if job.transaction_id not in existing]
+
+        inserted = categorize_and_insert_expenses(db, [
+            {
+                "transaction_id": job.transaction_id,
+                "user_id": job.user_id,
+                "merchant_name": job.merchant_name,
+                "merchant_category": job.merchant_category,
+                "amount": job.amount,
+                "user_balance_pre": job.user_balance_pre,
+                "timestamp": job.created_at
+            }
+            for job in fresh
+        ])
+        for job, expense in zip(fresh, inserted):
+            existing[job.transaction_id] = expense
+
+        now = datetime.utcnow()
+        for job in jobs:
+            expense = existing[job.transaction_id]
+            db.execute(
+                update(Job).where(_held(job.id)).values(
+                    status="done",
+                    attempts=job.attempts + 1,
+                    expense_id=expense["id"],
+                    category=expense["category"],
+                    urgency=expense["urgency"],
+                    error=None,
+                    processed_at=now
+                ).execution_options(synchronize_session=False)
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def _release_jobs(db: Session, jobs: list, error: Exception):
+    """Put failed jobs back in the queue, or park them once MAX_ATTEMPTS is reached."""
+    try:
+        database.begin_write(db)
+        for job in jobs:
+            attempts = job.attempts + 1
+            db.execute(
+                update(Job).where(_held(job.id)).values(
+                    status="failed" if attempts >= MAX_ATTEMPTS else "pending",
+                    attempts=attempts,
+                    error=str(error)[:500]
+                ).execution_options(synchronize_session=False)
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def process_pending_jobs(db: Session) -> int:
+    """Drain one batch of jobs. Returns how many were claimed."""
+    jobs = _claim_jobs(db)
+    if not jobs:
+        return 0
+
+    try:
+        _complete_jobs(db, jobs)
+        return len(jobs)
+    except Exception as e:
+        if len(jobs) == 1:
+            logger.error(f"Post-payment job for transaction {jobs[0].transaction_id} failed: {e}")
+            _release_jobs(db, jobs, e)
+            return 1
+        logger.error(f"Post-payment batch of {len(jobs)} failed, retrying one by one: {e}")
+
+    # A single bad job must not hold back the rest of the batch
+    for job in jobs:
+        try:
+            _complete_jobs(db, [job])
+        except Exception as e:
+            logger.error(f"Post-payment job for transaction {job.transaction_id} failed: {e}")
+            _release_jobs(db, [job], e)
+    return len(jobs)
+
+
+def _run():
+    # Jobs left 'processing' by a crashed worker are re-claimed once their lease expires
+    while True:
+        _wakeup.wait(POLL_SECONDS)
+        _wakeup.clear()
+        try:
+            with database.SessionLocal() as db:
+                while process_pending_jobs(db) == JOB_BATCH_SIZE:
+                    pass
+        except Exception as e:
+            logger.error(f"Post-payment worker error: {e}")
+
+
+def start_post_payment_worker():
+    global _worker
+    with _start_lock:
+        if _worker and _worker.is_alive():
+            return
+        _worker = threading.Thread(target=_run, name="post-payment-worker", daemon=True)
+        _worker.start()
+    logger.info("Post-payment worker started.")
+
+
+def _payment_job_query(db: Session, user_id: int, transaction_id: int):
+    return db.query(Job).filter(Job.transaction_id == transaction_id, Job.user_id == user_id)
+
+
+def _payment_expense_query(db: Session, user_id: int, transaction_id: int):
+    return db.query(database.Expense).filter(
+        database.Expense.transaction_id == transaction_id,
+        database.Expense.user_id == user_id
+    )
+
+
+def get_payment_status(db: Session, user_id: int, transaction_id: int):
+    """Categorization status of one of the user's payments, or None if unknown."""
+    job = _payment_job_query(db, user_id, transaction_id).first()
+    if not job:
+        # Categorized inline (sync mode): the linked Expense is the answer
+        expense = _payment_expense_query(db, user_id, transaction_id).first()
+        if not expense:
+            return None
+        return {
+            "transaction_id": transaction_id,
+            "status": "done",
+            "expense_id": expense.id,
+            "expense_category": expense.category,
+            "urgency": expense.urgency
+        }
+
+    return {
+        "transaction_id": transaction_id,
+        "status": job.status,
+        "expense_id": job.expense_id,
+        "expense_category": job.category or "pending",
+        "urgency": job.urgency or "pending"
+    }
@@ -1,10 +1,12 @@
 import joblib
 import os
-from datetime import datetime, timedelta
-import backend.database as database
+from datetime import datetime
 from sqlalchemy.orm import Session
 import pandas as pd
 
+from backend.utils.compiled_model import CompiledForest, COMPILED_MODEL_PATH, FEATURE_COLUMNS
+from backend.utils.recurrence import is_recurring
+
 # ===== Load ML models once =====
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 
@@ -12,9 +14,21 @@ MODEL_PATH = os.path.join(BASE_DIR, "resources", "Expense_categorization.pkl")
 MERCHANT_NAME_ENCODER = os.path.join(BASE_DIR, "resources", "merchant_name_encoder.pkl")
 MERCHANT_CATEGORY_ENCODER = os.path.join(BASE_DIR, "resources", "merchant_category_encoder.pkl")
 
-expense_model = joblib.load(MODEL_PATH)
-merchant_name_encoder = joblib.load(MERCHANT_NAME_ENCODER)
-merchant_category_encoder = joblib.load(MERCHANT_CATEGORY_ENCODER)
+# "sklearn" (default) or "numpy" -> compiled arrays from `python -m backend.utils.compiled_model export`
+MODEL_BACKEND = os.getenv("EXPENSE_MODEL_BACKEND", "sklearn").lower()
+
+if MODEL_BACKEND == "numpy":
+    compiled_model = CompiledForest.load(COMPILED_MODEL_PATH)
+    merchant_name_codes = compiled_model.merchant_name_codes
+    merchant_category_codes = compiled_model.merchant_category_codes
+else:
+    expense_model = joblib.load(MODEL_PATH)
+    merchant_name_encoder = joblib.load(MERCHANT_NAME_ENCODER)
+    merchant_category_encoder = joblib.load(MERCHANT_CATEGORY_ENCODER)
+
+    # LabelEncoder.transform is a per-call searchsorted; plain dicts give the same codes
+    merchant_name_codes = {name: code for code, name in enumerate(merchant_name_encoder.classes_)}
+    merchant_category_codes = {name: code for code, name in enumerate(merchant_category_encoder.classes_)}
 
 
 
@@ -28,17 +42,69 @@ def is_recurring_transaction(
     Returns:
     1 -> recurring
     0 -> not recurring
+
+    O(1) lookup on the maintained merchant_recurrence table
+    (see backend/utils/recurrence.py) instead of a COUNT over expenses.
+    """
+
+    return is_recurring(db, user_id, merchant_name, lookback_days)
+
+
+# ===== Label mappings =====
+CATEGORY_MAP = {
+    2: "red",
+    1: "orange",
+    0: "yellow"
+}
+
+# 🔹 Map category → urgency (example logic)
+URGENCY_MAP = {
+    "red": "critical",
+    "orange": "necessary",
+    "yellow": "discretionary"
+}
+
+
+def build_feature_row(
+    merchant_name: str,
+    merchant_category: str,
+    amount: float,
+    is_recurring: int,
+    user_balance_pre: float,
+    timestamp: datetime
+) -> list:
+    """Encode one payment into the model's feature order (unknown labels -> 0)."""
+    return [
+        merchant_name_codes.get(merchant_name, 0),          # Unknown merchant
+        merchant_category_codes.get(merchant_category, 0),  # Unknown category
+        amount,
+        is_recurring,
+        user_balance_pre,
+        timestamp.hour,
+        timestamp.weekday()
+    ]
+
+
+def predict_feature_rows(rows: list) -> list:
     """
+    Vectorized prediction for many encoded rows with a single model call.
 
-    start_date = datetime.utcnow() - timedelta(days=lookback_days)
+    Returns a list of (predicted_category, predicted_urgency) in input order.
+    """
+    if not rows:
+        return []
 
-    count = db.query(database.Expense).filter(
-        database.Expense.user_id == user_id,
-        database.Expense.merchant_name == merchant_name,
-        database.Expense.timestamp >= start_date
-    ).count()
+    if MODEL_BACKEND == "numpy":
+        predictions = compiled_model.predict(rows)
+    else:
+        feature_df = pd.DataFrame(rows, columns=FEATURE_COLUMNS)
+        predictions = expense_model.predict(feature_df)
 
-    return 1 if count >= 2 else 0
+    results = []
+    for prediction in predictions:
+        predicted_category = CATEGORY_MAP.get(int(prediction), "unknown")
+        results.append((predicted_category, URGENCY_MAP.get(predicted_category, "unknown")))
+    return results
 
 
 # ===== Prediction Function =====
@@ -56,57 +122,13 @@ def predict_expense_category(
     - predicted_urgency
     """
 
-    hour = timestamp.hour
-    day_of_week = timestamp.weekday()
-
-    try:
-        merchant_category_encoded = merchant_category_encoder.transform([merchant_category])[0]
-    except Exception:
-        merchant_category_encoded = 0  # Unknown category
-
-    try:
-        merchant_name_encoded = merchant_name_encoder.transform([merchant_name])[0]
-    except Exception:
-        merchant_name_encoded = 0  # Unknown merchant
-
-
-    cols = [
-        'merchant_name',
-        'merchant_category',
-        'amount',
-        'is_recurring',
-        'user_balance_pre',
-        'hour',
-        'day_of_week'
-    ]
-
-    feature_df = pd.DataFrame([[
-        merchant_name_encoded,
-        merchant_category_encoded,
-        amount,
-        is_recurring,
-        user_balance_pre,
-        hour,
-        day_of_week
-    ]], columns=cols)
-
-    prediction = expense_model.predict(feature_df)[0]
-
-    category_map = {
-        2: "red",
-        1: "orange",
-        0: "yellow"
-    }
-
-    predicted_category = category_map.get(int(prediction), "unknown")
-
-    # 🔹 Map category → urgency (example logic)
-    urgency_map = {
-        "red": "critical",
-        "orange": "necessary",
-        "yellow": "discretionary"
-    }
-
-    predicted_urgency = urgency_map.get(predicted_category, "unknown")
+    row = build_feature_row(
+        merchant_name=merchant_name,
+        merchant_category=merchant_category,
+        amount=amount,
+        is_recurring=is_recurring,
+        user_balance_pre=user_balance_pre,
+        timestamp=timestamp
+    )
 
-    return predicted_category, predicted_urgency
\ No newline at end of file
+    return predict_feature_rows([row])[0]
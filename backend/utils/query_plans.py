@@ -0,0 +1,124 @@
+import argparse
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import backend.database as database
+from backend.utils.ai_nudge_engine import _behavior_window_query, _last_nudge_query, nudge_history_query
+from backend.utils.category_spend import _month_spend_query
+from backend.utils.coach import recent_expenses_query
+from backend.utils.daily_spend import _breakdown_query, _period_totals_query
+from backend.utils.limit_job import _month_expenses_query
+from backend.utils.post_payment import _claimable_jobs_query, _payment_expense_query, _payment_job_query
+from backend.utils.recurrence import _prev_seen_query, _recurrence_state_query, _recurring_merchants_query
+from backend.utils.saving_estimator import _urgency_totals_query
+from backend.utils.spend_limit import _user_limits_query, month_expenses_query
+from backend.utils.transaction_history import _page, _user_history_query, _vendor_history_query
+from backend.utils.vendor_analytics import _payer_totals_query, _revenue_series_query, _top_payers_query
+
+# Sample bind values; plans depend on the shape of the query, not on these
+USER_ID = 1
+NOW = datetime(2025, 6, 15)
+MONTH_START = datetime(2025, 6, 1)
+NEXT_MONTH = datetime(2025, 7, 1)
+
+
+def hot_queries(db: Session) -> list:
+    """
+    (name, statement, params) for the per-request / per-user queries.
+
+    Every statement comes from the builder the route or util runs, so the
+    check follows the SQL that actually executes.
+    """
+    queries = [
+        ("transaction history (user)", _page(_user_history_query(db, USER_ID), limit=50)),
+        ("transaction history (vendor)", _page(_vendor_history_query(db, USER_ID), limit=50)),
+        ("insights spend breakdown", _breakdown_query(db, USER_ID, MONTH_START, NEXT_MONTH)),
+        ("insights daily totals", _period_totals_query(db, USER_ID, MONTH_START, NEXT_MONTH)),
+        ("insights weekly totals", _period_totals_query(db, USER_ID, MONTH_START, NEXT_MONTH, "week")),
+        ("insights recurring merchants in range", _recurring_merchants_query(db, USER_ID, start=MONTH_START, end=NEXT_MONTH)),
+        ("nudge behavior window", _behavior_window_query(db, USER_ID, NOW)),
+        ("nudge rate limit", _last_nudge_query(db, USER_ID, "alert")),
+        ("nudge history", nudge_history_query(db, USER_ID)),
+        ("spend limits (user)", _user_limits_query(db, USER_ID)),
+        ("spend limit generation", month_expenses_query(db, USER_ID, MONTH_START, NEXT_MONTH)),
+        ("spend limit job expenses", _month_expenses_query(db, USER_ID, USER_ID + 5000, MONTH_START, NEXT_MONTH)),
+        ("current month spend", _month_spend_query(db, USER_ID, MONTH_START)),
+        ("coach recent expenses", recent_expenses_query(db, USER_ID)),
+        ("savings urgency totals", _urgency_totals_query(db, USER_ID, MONTH_START, NEXT_MONTH)),
+        ("merchant recurrence", _prev_seen_query(db, USER_ID, "Swiggy")),
+        ("merchant recurrence (batch)", _recurrence_state_query(db, {(USER_ID, "Swiggy"), (USER_ID + 1, "Zomato")})),
+        ("payment status (job)", _payment_job_query(db, USER_ID, 1)),
+        ("payment status (expense)", _payment_expense_query(db, USER_ID, 1)),
+        ("vendor revenue series", _revenue_series_query(db, USER_ID, "day", MONTH_START, NEXT_MONTH)),
+        ("vendor payer totals", _payer_totals_query(db, USER_ID, MONTH_START, NEXT_MONTH)),
+        ("vendor top payers", _top_payers_query(db, USER_ID, MONTH_START, NEXT_MONTH, 5)),
+        ("claimable post-payment jobs", _claimable_jobs_query(db, NOW)),
+    ]
+    return [(name, query.statement, None) for name, query in queries]
+
+
+def explain(db: Session, statement, params=None) -> list:
+    """Plan lines for a statement: EXPLAIN QUERY PLAN on SQLite, EXPLAIN on Postgres."""
+    connection = db.connection()
+    prefix = "EXPLAIN QUERY PLAN " if connection.dialect.name == "sqlite" else "EXPLAIN "
+
+    # render_postcompile expands IN lists into one placeholder per value
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={"render_postcompile": True})
+    bound = compiled.construct_params(params or {})
+    if compiled.positiontup is not None:
+        args = tuple(bound[name] for name in compiled.positiontup)
+    else:
+        args = bound
+
+    rows = connection.exec_driver_sql(prefix + str(compiled), args).fetchall()
+    return [row[-1] for row in rows]  # SQLite: (id, parent, notused, detail); Postgres: (line,)
+
+
+def full_scans(dialect: str, plan: list) -> list:
+    """Plan lines that read a whole table instead of seeking an index."""
+    if dialect == "sqlite":
+        # "SCAN t" / "SCAN t USING COVERING INDEX i" walk every row; "SEARCH ..." seeks
+        return [line for line in plan if line.startswith("SCAN ")]
+    return [line for line in plan if "Seq Scan" in line]
+
+
+def check_plans(db: Session) -> dict:
+    """name -> offending plan lines, for every hot query that falls back to a full scan."""
+    connection = db.connection()
+    if connection.dialect.name == "postgresql":
+        # Tiny tables always get seq scans; ask whether an index path exists at all
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+
+    failures = {}
+    for name, statement, params in hot_queries(db):
+        scans = full_scans(connection.dialect.name, explain(db, statement, params))
+        if scans:
+            failures[name] = scans
+    return failures
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.query_plans [-v]
+    parser = argparse.ArgumentParser(description="Fail if a hot query plans a full table scan")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    database.init_db()
+    with database.SessionLocal() as session:
+        if args.verbose:
+            for name, statement, params in hot_queries(session):
+                print(f"{name}:")
+                for line in explain(session, statement, params):
+                    print(f"    {line}")
+
+        total = len(hot_queries(session))
+        failures = check_plans(session)
+        session.rollback()
+
+    for name, scans in failures.items():
+        print(f"FULL SCAN  {name}: {'; '.join(scans)}")
+    print(f"{len(failures)} of {total} hot queries fall back to a full scan")
+    if failures:
+        raise SystemExit(1)
@@ -0,0 +1,219 @@
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, or_, literal, DateTime
+from sqlalchemy.orm import Session
+
+import backend.database as database
+
+LOOKBACK_DAYS = 30
+Recurrence = database.MerchantRecurrence
+
+
+def _greatest(known, other):
+    """GREATEST(known, other) where `known` is never NULL (portable to SQLite)."""
+    return case((or_(other.is_(None), known >= other), known), else_=other)
+
+
+def record_merchant_visits(db: Session, visits: list):
+    """
+    Fold new (user_id, merchant_name, timestamp) expenses into the recurrence
+    table inside the caller's transaction. Visits are merged per pair first so
+    each row is upserted once.
+    """
+    top_two = {}
+    for user_id, merchant_name, timestamp in visits:
+        seen = top_two.setdefault((user_id, merchant_name), [])
+        seen.append(timestamp)
+        seen.sort(reverse=True)
+        del seen[2:]
+
+    insert = database.dialect_insert(db)
+    for (user_id, merchant_name), seen in top_two.items():
+        new_last = literal(seen[0], DateTime)
+        new_prev = seen[1] if len(seen) > 1 else None
+
+        # Merge the stored top-2 with the new top-2
+        if new_prev is None:
+            prev_if_newer = Recurrence.last_seen
+        else:
+            prev_if_newer = _greatest(literal(new_prev, DateTime), Recurrence.last_seen)
+
+        newer = new_last >= Recurrence.last_seen
+        stmt = insert(Recurrence).values(
+            user_id=user_id,
+            merchant_name=merchant_name,
+            last_seen=seen[0],
+            prev_seen=new_prev
+        ).on_conflict_do_update(
+            index_elements=["user_id", "merchant_name"],
+            set_={
+                "last_seen": case((newer, new_last), else_=Recurrence.last_seen),
+                "prev_seen": case((newer, prev_if_newer), else_=_greatest(new_last, Recurrence.prev_seen))
+            }
+        )
+        db.execute(stmt)
+
+
+def _recurrence_state_query(db: Session, pairs: set):
+    return db.query(
+        Recurrence.user_id, Recurrence.merchant_name, Recurrence.last_seen, Recurrence.prev_seen
+    ).filter(
+        Recurrence.user_id.in_({user_id for user_id, _ in pairs}),
+        Recurrence.merchant_name.in_({name for _, name in pairs})
+    )
+
+
+def get_recurrence_state(db: Session, pairs: set) -> dict:
+    """(user_id, merchant_name) -> [last_seen, prev_seen] for many pairs in one query."""
+    if not pairs:
+        return {}
+
+    rows = _recurrence_state_query(db, pairs).all()
+
+    return {
+        (user_id, name): [ts for ts in (last_seen, prev_seen) if ts]
+        for user_id, name, last_seen, prev_seen in rows
+        if (user_id, name) in pairs
+    }
+
+
+def _prev_seen_query(db: Session, user_id: int, merchant_name: str):
+    return db.query(Recurrence.prev_seen).filter(
+        Recurrence.user_id == user_id,
+        Recurrence.merchant_name == merchant_name
+    )
+
+
+def is_recurring(db: Session, user_id: int, merchant_name: str, lookback_days: int = LOOKBACK_DAYS) -> int:
+    prev_seen = _prev_seen_query(db, user_id, merchant_name).scalar()
+
+    start_date = datetime.utcnow() - timedelta(days=lookback_days)
+    return 1 if prev_seen and prev_seen >= start_date else 0
+
+
+def _recurring_merchants_query(db: Session, user_id: int, lookback_days: int = LOOKBACK_DAYS,
+                               start=None, end=None):
+    start_date = datetime.utcnow() - timedelta(days=lookback_days)
+    query = db.query(Recurrence.merchant_name).filter(
+        Recurrence.user_id == user_id,
+        Recurrence.prev_seen >= start_date
+    )
+    if start is not None and end is not None:
+        query = query.filter(
+            db.query(database.Expense.id).filter(
+                database.Expense.user_id == Recurrence.user_id,
+                database.Expense.merchant_name == Recurrence.merchant_name,
+                database.Expense.timestamp >= start,
+                database.Expense.timestamp <= end
+            ).exists()
+        )
+    return query
+
+
+def recurring_merchants(db: Session, user_id: int, lookback_days: int = LOOKBACK_DAYS,
+                        start=None, end=None) -> set:
+    """
+    Every merchant is_recurring() would flag for this user, in one query.
+    With start / end, only those the user also paid within [start, end]
+    (one index probe per recurring merchant, not a scan of the range).
+    """
+    return {name for (name,) in _recurring_merchants_query(db, user_id, lookback_days, start, end).all()}
+
+
+# ===== Rebuild / consistency check =====
+def count_recent_merchant_expenses(db: Session, lookback_days: int = LOOKBACK_DAYS) -> dict:
+    """The original per-payment COUNT(*), for every (user, merchant) pair at once."""
+    start_date = datetime.utcnow() - timedelta(days=lookback_days)
+    rows = db.query(
+        database.Expense.user_id,
+        database.Expense.merchant_name,
+        func.count(database.Expense.id)
+    ).filter(
+        database.Expense.timestamp >= start_date
+    ).group_by(database.Expense.user_id, database.Expense.merchant_name).all()
+
+    return {(user_id, name): count for user_id, name, count in rows}
+
+
+def recompute_recurrence(db: Session) -> int:
+    """Replace the table with one recomputed from expenses, inside the caller's transaction."""
+    ranked = db.query(
+        database.Expense.user_id,
+        database.Expense.merchant_name,
+        database.Expense.timestamp,
+        func.row_number().over(
+            partition_by=(database.Expense.user_id, database.Expense.merchant_name),
+            order_by=(database.Expense.timestamp.desc(), database.Expense.id.desc())
+        ).label("rn")
+    ).subquery()
+
+    rows = db.query(
+        ranked.c.user_id, ranked.c.merchant_name, ranked.c.timestamp, ranked.c.rn
+    ).filter(ranked.c.rn <= 2).all()
+
+    pairs = {}
+    for user_id, merchant_name, timestamp, rn in rows:
+        entry = pairs.setdefault((user_id, merchant_name), {"user_id": user_id, "merchant_name": merchant_name, "prev_seen": None})
+        entry["last_seen" if rn == 1 else "prev_seen"] = timestamp
+
+    db.query(Recurrence).delete()
+    if pairs:
+        db.bulk_insert_mappings(Recurrence, list(pairs.values()))
+    return len(pairs)
+
+
+def rebuild_recurrence(db: Session) -> int:
+    """Recompute the table from expenses (two newest timestamps per pair)."""
+    try:
+        database.begin_write(db)
+        written = recompute_recurrence(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return written
+
+
+def backfill_if_empty(db: Session) -> int:
+    if db.query(Recurrence.id).first() or not db.query(database.Expense.id).first():
+        return 0
+    return rebuild_recurrence(db)
+
+
+def check_recurrence(db: Session, lookback_days: int = LOOKBACK_DAYS) -> list:
+    """Pairs whose O(1) answer disagrees with the COUNT query."""
+    counts = count_recent_merchant_expenses(db, lookback_days)
+    start_date = datetime.utcnow() - timedelta(days=lookback_days)
+
+    flagged = {
+        (user_id, name)
+        for user_id, name in db.query(Recurrence.user_id, Recurrence.merchant_name).filter(
+            Recurrence.prev_seen >= start_date
+        ).all()
+    }
+    expected = {pair for pair, count in counts.items() if count >= 2}
+
+    return sorted(flagged ^ expected)
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.recurrence {rebuild,check}
+    parser = argparse.ArgumentParser(description="Maintain the merchant recurrence table")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    database.init_db()
+    session = database.SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"Rebuilt recurrence for {rebuild_recurrence(session)} (user, merchant) pairs")
+
+        mismatches = check_recurrence(session)
+        print(f"{len(mismatches)} mismatching (user, merchant) pairs")
+        for pair in mismatches[:20]:
+            print(f"  {pair}")
+        if mismatches:
+            raise SystemExit(1)
+    finally:
+        session.close()
@@ -3,6 +3,17 @@ from sqlalchemy import func
 from backend.database import Expense, User, Wallet
 
 
+def _urgency_totals_query(db: Session, user_id: int, start_date, end_date):
+    return db.query(
+        Expense.urgency,
+        func.sum(Expense.amount)
+    ).filter(
+        Expense.user_id == user_id,
+        Expense.timestamp >= start_date,
+        Expense.timestamp <= end_date
+    ).group_by(Expense.urgency)
+
+
 def estimate_savings_potential(
     db: Session,
     user_id: int,
@@ -25,14 +36,7 @@ def estimate_savings_potential(
     total_balance = float(wallets or 0.0)
 
     # 2️⃣ Sum expenses by urgency
-    expenses = db.query(
-        Expense.urgency,
-        func.sum(Expense.amount)
-    ).filter(
-        Expense.user_id == user_id,
-        Expense.timestamp >= start_date,
-        Expense.timestamp <= end_date
-    ).group_by(Expense.urgency).all()
+    expenses = _urgency_totals_query(db, user_id, start_date, end_date).all()
 
     print("Expenses", expenses)
 
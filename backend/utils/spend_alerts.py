@@ -0,0 +1,140 @@
+"""
+Spend-limit alerts detected when a payment is recorded and pushed to the
+user's open dashboards over Server-Sent Events.
+
+record_expense_side_effects calls detect_spend_alerts inside the payment
+transaction, right after the monthly category counters are bumped. An
+alert fires only when a counter moves into a higher level (ok -> warning
+-> danger) for a limit saved with save_user_limits. Alerts wait on the
+session and are published after it commits, so a rolled-back payment
+never alerts.
+
+Subscribers live in this process. Behind several workers, a client only
+receives alerts for payments handled by the worker it is connected to.
+The next /spend/alerts poll still shows the full picture.
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import backend.database as database
+from backend.utils.category_spend import month_start
+from backend.utils.spend_limit import _norm_category, alert_level, get_month_range, get_user_limits, spend_alert
+
+KEEPALIVE_SECONDS = float(os.getenv("ALERT_STREAM_KEEPALIVE_SECONDS", "15"))
+SUBSCRIBER_QUEUE_SIZE = 100
+
+_PENDING = "pending_spend_alerts"
+
+
+def detect_spend_alerts(db: Session, expenses: list):
+    """
+    Queue alerts for limits the new expenses push over their threshold or limit.
+
+    expenses: dicts with user_id, merchant_category, amount and timestamp,
+    already added to monthly_category_spend in this transaction.
+    """
+    current_month, _ = get_month_range()
+
+    added = defaultdict(float)  # (user_id, category) -> amount this batch added
+    for e in expenses:
+        if month_start(e["timestamp"]) == current_month:
+            added[(e["user_id"], _norm_category(e["merchant_category"]))] += e["amount"]
+
+    watched = {}
+    for user_id, category in added:
+        for limit in get_user_limits(db, user_id):
+            if limit.category == category:
+                watched.setdefault((user_id, category), []).append(limit)
+    if not watched:
+        return
+
+    CategorySpend = database.MonthlyCategorySpend
+    totals = db.query(CategorySpend.user_id, CategorySpend.category, CategorySpend.amount).filter(
+        CategorySpend.month == current_month,
+        CategorySpend.user_id.in_(sorted({user_id for user_id, _ in watched})),
+        CategorySpend.category.in_(sorted({category for _, category in watched}))
+    ).all()
+
+    pending = db.info.setdefault(_PENDING, [])
+    for user_id, category, spend in totals:
+        for limit in watched.get((user_id, category), []):
+            level = alert_level(limit, spend)
+            if level and level != alert_level(limit, spend - added[(user_id, category)]):
+                pending.append((user_id, spend_alert(limit, spend)))
+
+
+@event.listens_for(database.SessionLocal, "after_commit")
+def _publish_pending(session):
+    for user_id, alert in session.info.pop(_PENDING, []):
+        alert_broker.publish(user_id, alert)
+
+
+@event.listens_for(database.SessionLocal, "after_rollback")
+def _drop_pending(session):
+    session.info.pop(_PENDING, None)
+
+
+class AlertBroker:
+    """Fan-out of alerts to each user's connected SSE streams (one asyncio queue each)."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)  # user_id -> {(loop, queue)}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[user_id].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id, set())
+            subscribers -= {entry for entry in subscribers if entry[1] is queue}
+            if not subscribers:
+                self._subscribers.pop(user_id, None)
+
+    def publish(self, user_id: int, alert: dict):
+        """Thread-safe: payments commit on worker threads, streams run on the event loop."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_offer, queue, alert)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._subscribers),
+                "streams": sum(len(subscribers) for subscribers in self._subscribers.values())
+            }
+
+
+def _offer(queue: asyncio.Queue, alert: dict):
+    if queue.full():
+        queue.get_nowait()  # slow client: drop its oldest alert
+    queue.put_nowait(alert)
+
+
+alert_broker = AlertBroker()
+
+
+async def alert_events(user_id: int, is_disconnected):
+    """SSE body: one `spend_alert` event per alert, comments as keepalives."""
+    queue = alert_broker.subscribe(user_id)
+    try:
+        yield "retry: 5000\n\n"
+        while not await is_disconnected():
+            try:
+                alert = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: spend_alert\ndata: {json.dumps(alert)}\n\n"
+    finally:
+        alert_broker.unsubscribe(user_id, queue)
@@ -1,8 +1,24 @@
+import os
+from collections import defaultdict, namedtuple
+
 import pandas as pd
 from sqlalchemy.orm import Session
-from backend.database import UserSpendLimit
+from backend.database import Expense, UserSpendLimit, begin_write, dialect_insert
+from backend.utils.cache import TTLCache
+from backend.utils.data_version import bump_limit_versions, get_limit_version
 from datetime import datetime
 
+# A user's saved limits, as read on every payment / alert check
+SpendLimit = namedtuple("SpendLimit", ["category", "limit", "alert_threshold"])
+
+# Keyed by (user_id, limit version): saving limits bumps the version in the
+# database, so every worker misses on its next read. The TTL only bounds how
+# long superseded versions occupy memory.
+limit_cache = TTLCache(
+    max_entries=int(os.getenv("LIMIT_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("LIMIT_CACHE_TTL", "300"))
+)
+
 
 def _norm_category(cat: str) -> str:
     return str(cat).strip().title()
@@ -19,6 +35,15 @@ def get_month_range():
     return month_start, next_month
 
 
+def month_expenses_query(db: Session, user_id: int, month_start: datetime, next_month: datetime):
+    """(merchant_category, amount) of the user's expenses in [month_start, next_month)."""
+    return db.query(Expense.merchant_category, Expense.amount).filter(
+        Expense.user_id == user_id,
+        Expense.timestamp >= month_start,
+        Expense.timestamp < next_month
+    )
+
+
 def generate_spend_limits(df: pd.DataFrame, income: float, savings_goal: float):
     limits = []
 
@@ -59,27 +84,94 @@ def generate_spend_limits(df: pd.DataFrame, income: float, savings_goal: float):
     return limits
 
 
-def save_user_limits(db: Session, user_id: int, limits: list):
-    """Save or update spend limits in DB — deletes old limits first."""
-    db.query(UserSpendLimit).filter(UserSpendLimit.user_id == user_id).delete()
-    db.commit()
+def _user_limits_query(db: Session, user_id: int):
+    return db.query(
+        UserSpendLimit.category, UserSpendLimit.limit, UserSpendLimit.alert_threshold
+    ).filter(UserSpendLimit.user_id == user_id)
 
-    for limit in limits:
-        db_limit = UserSpendLimit(
-            user_id=user_id,
-            category=limit['category'],
-            limit=float(limit['limit']),
-            alert_threshold=float(limit['alert_threshold'])
-        )
-        db.add(db_limit)
-    db.commit()
+
+def get_user_limits(db: Session, user_id: int) -> list:
+    """
+    SpendLimit tuples for a user (empty if none), cached per limit version.
+
+    The version is read first: limits saved in between land under a newer
+    key, so a cached entry is never older than its version.
+    """
+    key = (user_id, get_limit_version(db, user_id))
+    limits = limit_cache.get(key)
+    if limits is None:
+        limits = [
+            SpendLimit(category, limit, alert_threshold)
+            for category, limit, alert_threshold in _user_limits_query(db, user_id).all()
+        ]
+        limit_cache.set(key, limits)
+    return limits
+
+
+def upsert_user_limits(db: Session, user_ids: list, rows: list):
+    """
+    Replace the limits of `user_ids` with `rows` inside the caller's transaction.
+
+    rows: dicts with user_id, category, limit and alert_threshold. Rows are
+    upserted on (user_id, category) as one executemany; each user's rows for
+    categories the new rows no longer cover are deleted (one DELETE per
+    distinct category set, not per user). Callers bump the users' limit
+    versions in the same transaction (bump_limit_versions).
+    """
+    stamp = datetime.utcnow()
+    if rows:
+        stmt = dialect_insert(db)(UserSpendLimit)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "category"],
+            set_={
+                "limit": stmt.excluded.limit,
+                "alert_threshold": stmt.excluded.alert_threshold,
+                "created_at": stmt.excluded.created_at
+            }
+        ), [{**row, "created_at": stamp} for row in rows])
+
+    # Decided by category, not by created_at: timestamps from different
+    # servers (or overlapping jobs) cannot tell fresh rows from stale ones
+    categories = defaultdict(set)
+    for row in rows:
+        categories[row["user_id"]].add(row["category"])
+    users_by_categories = defaultdict(list)
+    for user_id in user_ids:
+        users_by_categories[frozenset(categories[user_id])].append(user_id)
+
+    for kept, users in users_by_categories.items():
+        stale = db.query(UserSpendLimit).filter(UserSpendLimit.user_id.in_(users))
+        if kept:
+            stale = stale.filter(UserSpendLimit.category.notin_(sorted(kept)))
+        stale.delete(synchronize_session=False)
+
+
+def save_user_limits(db: Session, user_id: int, limits: list):
+    """Replace a user's spend limits with one bulk upsert in a single transaction."""
+    rows = [
+        {
+            "user_id": user_id,
+            "category": limit['category'],
+            "limit": float(limit['limit']),
+            "alert_threshold": float(limit['alert_threshold'])
+        }
+        for limit in limits
+    ]
+    try:
+        begin_write(db)
+        upsert_user_limits(db, [user_id], rows)
+        bump_limit_versions(db, [user_id])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
 
 
 def check_spend_alerts(db: Session, user_id: int, current_spend: dict):
     """Compare user spend against saved limits and return alerts.
     current_spend keys are normalized before comparison."""
     alerts = []
-    limits = db.query(UserSpendLimit).filter(UserSpendLimit.user_id == user_id).all()
+    limits = get_user_limits(db, user_id)
 
     if not limits:
         return [{
@@ -91,17 +183,33 @@ def check_spend_alerts(db: Session, user_id: int, current_spend: dict):
     normalized_spend = {_norm_category(k): v for k, v in current_spend.items()}
 
     for limit in limits:
-        spend = normalized_spend.get(limit.category, 0)
-        if spend >= limit.alert_threshold and spend < limit.limit:
-            alerts.append({
-                "type": "warning",
-                "category": limit.category,
-                "message": f"Approaching limit in {limit.category}: ₹{spend:.0f} / ₹{limit.limit:.0f}"
-            })
-        elif spend >= limit.limit:
-            alerts.append({
-                "type": "danger",
-                "category": limit.category,
-                "message": f"Exceeded limit in {limit.category}: ₹{spend:.0f} / ₹{limit.limit:.0f}"
-            })
-    return alerts
\ No newline at end of file
+        alert = spend_alert(limit, normalized_spend.get(limit.category, 0))
+        if alert:
+            alerts.append(alert)
+    return alerts
+
+
+def alert_level(limit, spend: float):
+    """"danger" at or over the limit, "warning" at or over the threshold, else None."""
+    if spend >= limit.limit:
+        return "danger"
+    if spend >= limit.alert_threshold:
+        return "warning"
+    return None
+
+
+def spend_alert(limit, spend: float):
+    level = alert_level(limit, spend)
+    if level == "warning":
+        return {
+            "type": "warning",
+            "category": limit.category,
+            "message": f"Approaching limit in {limit.category}: ₹{spend:.0f} / ₹{limit.limit:.0f}"
+        }
+    if level == "danger":
+        return {
+            "type": "danger",
+            "category": limit.category,
+            "message": f"Exceeded limit in {limit.category}: ₹{spend:.0f} / ₹{limit.limit:.0f}"
+        }
+    return None
\ No newline at end of file
@@ -0,0 +1,357 @@
+import argparse
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, event, or_, text
+from sqlalchemy.orm import Session, aliased
+
+import backend.database as database
+
+Transaction = database.Transaction
+Expense = database.Expense
+
+# Plain columns rather than the entity, so streamed rows skip the identity map
+TRANSACTION_COLUMNS = (
+    Transaction.id,
+    Transaction.timestamp,
+    Transaction.amount,
+    Transaction.status,
+    Transaction.sender_id,
+    Transaction.sender_wallet_id,
+    Transaction.receiver_id,
+    Transaction.receiver_wallet_id,
+    Transaction.receiver_type
+)
+
+# Legacy expenses were written by a second commit right after their transaction
+LINK_TOLERANCE = timedelta(minutes=5)
+
+
+STREAM_CHUNK_ROWS = 1000
+
+
+# ===== Keyset cursors: "<timestamp iso>|<transaction id>" =====
+def encode_cursor(row: dict) -> str:
+    return f"{row['timestamp']}|{row['id']}"
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, tx_id = cursor.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(tx_id)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def _page(query, limit: int = None, before: str = None):
+    """Newest first on (timestamp, id); `before` continues after the last row of a page."""
+    if before:
+        timestamp, tx_id = decode_cursor(before)
+        query = query.filter(or_(
+            Transaction.timestamp < timestamp,
+            and_(Transaction.timestamp == timestamp, Transaction.id < tx_id)
+        ))
+    query = query.order_by(Transaction.timestamp.desc(), Transaction.id.desc())
+    return query.limit(limit) if limit else query
+
+
+def _stream(query):
+    """Rows from a server-side cursor, fetched STREAM_CHUNK_ROWS at a time."""
+    return query.execution_options(stream_results=True, yield_per=STREAM_CHUNK_ROWS)
+
+
+def _date_range(query, start: datetime = None, end: datetime = None):
+    if start:
+        query = query.filter(Transaction.timestamp >= start)
+    if end:
+        query = query.filter(Transaction.timestamp <= end)
+    return query
+
+
+# ===== User history =====
+def _user_history_query(db: Session, user_id: int):
+    sender = aliased(database.User)
+    receiver = aliased(database.User)
+
+    return (
+        db.query(
+            *TRANSACTION_COLUMNS,
+            Expense.user_id.label("expense_user_id"),
+            Expense.category.label("expense_category"),
+            Expense.urgency,
+            database.Vendor.business_name,
+            database.Vendor.category.label("vendor_category"),
+            receiver.username.label("receiver_name"),
+            sender.username.label("sender_name")
+        )
+        # Join on transaction_id alone so each row is one ix_expenses_transaction_id
+        # probe; whose expense it is gets checked in _user_history_row
+        .outerjoin(Expense, Expense.transaction_id == Transaction.id)
+        .outerjoin(database.Vendor, and_(Transaction.receiver_type == "vendor", database.Vendor.id == Transaction.receiver_id))
+        .outerjoin(receiver, and_(Transaction.receiver_type == "user", receiver.id == Transaction.receiver_id))
+        .outerjoin(sender, sender.id == Transaction.sender_id)
+        .filter(
+            Transaction.status == "success",
+            or_(
+                Transaction.sender_id == user_id,
+                and_(Transaction.receiver_id == user_id, Transaction.receiver_type == "user")
+            )
+        )
+    )
+
+
+def _user_history_row(user_id: int, row) -> dict:
+    tx_type = "Unknown"
+    is_expense = False
+    counterparty = "Unknown"
+    category = "Other"
+
+    # ---------------- OUTGOING ----------------
+    if row.sender_id == user_id:
+        tx_type = "Sent"
+        if row.receiver_type == "vendor":
+            counterparty = row.business_name or "Vendor"
+            category = row.vendor_category or "General"
+            is_expense = True
+        elif row.receiver_type == "user":
+            counterparty = row.receiver_name or "Other User"
+            category = "Transfer"
+
+    # ---------------- INCOMING ----------------
+    elif row.receiver_id == user_id and row.receiver_type == "user":
+        tx_type = "Received"
+        counterparty = row.sender_name or "External Source"
+
+    # The linked Expense belongs to the payer; received payments show none
+    own_expense = row.expense_user_id == user_id
+
+    return {
+        "id": row.id,
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+        "amount": float(row.amount),
+        "type": tx_type,
+        "party_name": counterparty,
+        "party_wallet_id": row.receiver_wallet_id if row.sender_id == user_id else row.sender_wallet_id,
+        "category": category,
+        "expense_category": row.expense_category if own_expense else None,  # From the linked Expense
+        "urgency": row.urgency if own_expense else None,
+        "status": row.status,
+        "is_expense": is_expense
+    }
+
+
+def get_user_history(db: Session, user_id: int, limit: int = None, before: str = None) -> list:
+    """Sent and received payments of a user, newest first, in one query."""
+    rows = _page(_user_history_query(db, user_id), limit, before).all()
+    return [_user_history_row(user_id, row) for row in rows]
+
+
+def stream_user_history(db: Session, user_id: int, before: str = None, start: datetime = None, end: datetime = None):
+    query = _date_range(_user_history_query(db, user_id), start, end)
+    for row in _stream(_page(query, before=before)):
+        yield _user_history_row(user_id, row)
+
+
+# ===== Vendor history =====
+def _vendor_history_query(db: Session, vendor_id: int):
+    return (
+        db.query(*TRANSACTION_COLUMNS, database.User.username.label("sender_name"))
+        .outerjoin(database.User, database.User.id == Transaction.sender_id)
+        .filter(
+            Transaction.status == "success",
+            Transaction.receiver_id == vendor_id,
+            Transaction.receiver_type == "vendor"
+        )
+    )
+
+
+def _vendor_history_row(vendor_category: str, row) -> dict:
+    return {
+        "id": row.id,
+        "timestamp": row.timestamp.isoformat() if row.timestamp else None,
+        "amount": float(row.amount),
+        "type": "Received",
+        "party_name": row.sender_name or "Unknown User",  # Sender is always a User
+        "party_wallet_id": row.sender_wallet_id,
+        "category": vendor_category,   # vendor's own category
+        "urgency": None,
+        "status": row.status,
+        "is_expense": False
+    }
+
+
+def get_vendor_history(db: Session, vendor: database.Vendor, limit: int = None, before: str = None) -> list:
+    """Payments received by a vendor, newest first, in one query."""
+    rows = _page(_vendor_history_query(db, vendor.id), limit, before).all()
+    return [_vendor_history_row(vendor.category, row) for row in rows]
+
+
+def stream_vendor_history(db: Session, vendor_id: int, vendor_category: str, before: str = None,
+                          start: datetime = None, end: datetime = None):
+    query = _date_range(_vendor_history_query(db, vendor_id), start, end)
+    for row in _stream(_page(query, before=before)):
+        yield _vendor_history_row(vendor_category, row)
+
+
+# ===== Backfill for expenses written before the transaction link =====
+def match_legacy_expenses(db: Session, tolerance: timedelta = LINK_TOLERANCE) -> int:
+    """
+    Set Expense.transaction_id where it is missing, inside the caller's transaction.
+
+    Each unlinked expense is matched to an unlinked successful payment by the
+    same user for the same amount, taking the one closest in time (within
+    `tolerance`); a transaction is never linked twice.
+    """
+    expenses = db.query(Expense.id, Expense.user_id, Expense.amount, Expense.timestamp).filter(
+        Expense.transaction_id.is_(None)
+    ).order_by(Expense.timestamp).all()
+    if not expenses:
+        return 0
+
+    linked = db.query(Expense.transaction_id).filter(Expense.transaction_id.isnot(None))
+    candidates = defaultdict(list)
+    for tx_id, sender_id, amount, timestamp in db.query(
+        Transaction.id, Transaction.sender_id, Transaction.amount, Transaction.timestamp
+    ).filter(
+        Transaction.status == "success",
+        Transaction.sender_id.in_({e.user_id for e in expenses}),
+        Transaction.id.notin_(linked)
+    ).all():
+        candidates[(sender_id, amount)].append((timestamp, tx_id))
+
+    links = []
+    for expense in expenses:
+        pool = candidates.get((expense.user_id, expense.amount))
+        if not pool or not expense.timestamp:
+            continue
+
+        best = None
+        for i, (timestamp, _) in enumerate(pool):
+            gap = abs(expense.timestamp - timestamp) if timestamp else None
+            if gap is not None and gap <= tolerance and (best is None or gap < best[0]):
+                best = (gap, i)
+
+        if best:
+            links.append({"id": expense.id, "transaction_id": pool.pop(best[1])[1]})
+
+    if links:
+        db.bulk_update_mappings(Expense, links)
+    return len(links)
+
+
+def link_legacy_expenses(db: Session, tolerance: timedelta = LINK_TOLERANCE) -> int:
+    """match_legacy_expenses in its own write transaction. Returns the number linked."""
+    try:
+        database.begin_write(db)
+        linked = match_legacy_expenses(db, tolerance)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return linked
+
+
+# ===== Query-count benchmark =====
+def _seed(db: Session, payments: int) -> tuple:
+    user = database.User(username="bench", email=f"bench{payments}@x.com", phone=f"9{payments:09d}", hashed_password="-")
+    friend = database.User(username="friend", email=f"friend{payments}@x.com", phone=f"8{payments:09d}", hashed_password="-")
+    vendor = database.Vendor(business_name="Bench Mart", email=f"v{payments}@x.com", phone=f"7{payments:09d}", category="Grocery", hashed_password="-")
+    db.add_all([user, friend, vendor])
+    db.flush()
+
+    now = datetime.utcnow()
+    for i in range(payments):
+        to_vendor = i % 3 != 0
+        tx = Transaction(
+            sender_id=user.id if i % 5 else friend.id,
+            sender_wallet_id="WAL-USR-A",
+            receiver_id=vendor.id if to_vendor else (friend.id if i % 5 else user.id),
+            receiver_wallet_id="WAL-VND-B" if to_vendor else "WAL-USR-C",
+            receiver_type="vendor" if to_vendor else "user",
+            amount=float(100 + i % 7),
+            status="success",
+            timestamp=now - timedelta(minutes=i)
+        )
+        db.add(tx)
+        db.flush()
+        if to_vendor:
+            db.add(Expense(
+                transaction_id=tx.id, user_id=tx.sender_id, merchant_name="Bench Mart", merchant_category="Grocery",
+                amount=tx.amount, category="yellow", urgency="discretionary", timestamp=tx.timestamp
+            ))
+    db.commit()
+    return user, vendor
+
+
+def benchmark(sizes=(10, 100, 1000, 5000), legacy_expenses: int = 50_000):
+    """
+    Query count and latency per history size on a scratch in-memory database.
+
+    `legacy_expenses` unlinked expenses (one per other user, as written before
+    the transaction link) are added and the database ANALYZEd, so the planner
+    sees the row statistics of a long-lived database.
+    """
+    from sqlalchemy import create_engine, insert
+    from sqlalchemy.orm import sessionmaker
+
+    engine = create_engine("sqlite://")
+    database.Base.metadata.create_all(engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(1))
+
+    with sessionmaker(bind=engine)() as db:
+        if legacy_expenses:
+            db.execute(insert(Expense), [
+                {"user_id": 1_000_000 + i, "merchant_name": "Legacy", "merchant_category": "Other", "amount": 1.0}
+                for i in range(legacy_expenses)
+            ])
+            db.commit()
+
+        for size in sizes:
+            user, vendor = _seed(db, size)
+            user_id = user.id
+            db.refresh(vendor)
+            db.execute(text("ANALYZE"))
+
+            statements.clear()
+            started = time.perf_counter()
+            history = get_user_history(db, user_id)
+            user_ms = (time.perf_counter() - started) * 1000
+            user_queries = len(statements)
+
+            statements.clear()
+            started = time.perf_counter()
+            get_vendor_history(db, vendor)
+            vendor_ms = (time.perf_counter() - started) * 1000
+            vendor_queries = len(statements)
+
+            started = time.perf_counter()
+            stream = stream_vendor_history(db, vendor.id, vendor.category)
+            next(stream)
+            first_row_ms = (time.perf_counter() - started) * 1000
+            stream.close()
+
+            statements.clear()
+            page = get_user_history(db, user_id, limit=50, before=encode_cursor(history[len(history) // 2]))
+            page_queries = len(statements)
+
+            print(
+                f"{size:>5} payments: user history {len(history):>5} rows, {user_queries} queries, {user_ms:.1f} ms | "
+                f"vendor history {vendor_queries} queries, {vendor_ms:.1f} ms, "
+                f"stream first row {first_row_ms:.1f} ms | page of {len(page)}: {page_queries} queries"
+            )
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.transaction_history {backfill,benchmark}
+    parser = argparse.ArgumentParser(description="Transaction history maintenance")
+    parser.add_argument("command", choices=["backfill", "benchmark"])
+    args = parser.parse_args()
+
+    if args.command == "benchmark":
+        benchmark()
+    else:
+        database.init_db()
+        with database.SessionLocal() as session:
+            print(f"Linked {link_legacy_expenses(session)} expenses to their transactions")
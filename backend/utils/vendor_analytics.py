@@ -0,0 +1,245 @@
+import argparse
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import backend.database as database
+from backend.utils.wallet_shards import VENDOR_WALLET_SHARDS
+
+Rollup = database.VendorRevenueRollup
+DailyPayer = database.VendorDailyPayer
+
+GRANULARITIES = ("hour", "day", "month")
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _aggregate(payments) -> tuple:
+    """
+    (vendor_id, user_id, amount, timestamp) payments -> rollup rows, merged
+    per key so each row is written once.
+    """
+    revenue = defaultdict(lambda: [0.0, 0])
+    payers = defaultdict(lambda: [0.0, 0])
+
+    for vendor_id, user_id, amount, timestamp in payments:
+        # Different payers land on different rows of a hot vendor's bucket
+        shard = user_id % VENDOR_WALLET_SHARDS if VENDOR_WALLET_SHARDS > 0 else 0
+        for granularity in GRANULARITIES:
+            totals = revenue[(vendor_id, granularity, bucket_start(timestamp, granularity), shard)]
+            totals[0] += amount
+            totals[1] += 1
+
+        totals = payers[(vendor_id, bucket_start(timestamp, "day"), user_id)]
+        totals[0] += amount
+        totals[1] += 1
+
+    revenue_rows = [
+        {"vendor_id": v, "granularity": g, "bucket": b, "shard": s, "revenue": total, "payments": count}
+        for (v, g, b, s), (total, count) in sorted(revenue.items())
+    ]
+    payer_rows = [
+        {"vendor_id": v, "day": d, "user_id": u, "amount": total, "payments": count}
+        for (v, d, u), (total, count) in sorted(payers.items())
+    ]
+    return revenue_rows, payer_rows
+
+
+def record_vendor_payments(db: Session, payments: list):
+    """
+    Add received vendor payments to the rollups inside the caller's transaction.
+
+    payments: (vendor_id, user_id, amount, timestamp) tuples. Rows are
+    upserted in key order so concurrent payers cannot deadlock.
+    """
+    if not payments:
+        return
+
+    revenue_rows, payer_rows = _aggregate(payments)
+    insert = database.dialect_insert(db)
+
+    stmt = insert(Rollup).values(revenue_rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["vendor_id", "granularity", "bucket", "shard"],
+        set_={
+            "revenue": Rollup.revenue + stmt.excluded.revenue,
+            "payments": Rollup.payments + stmt.excluded.payments
+        }
+    ))
+
+    stmt = insert(DailyPayer).values(payer_rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["vendor_id", "day", "user_id"],
+        set_={
+            "amount": DailyPayer.amount + stmt.excluded.amount,
+            "payments": DailyPayer.payments + stmt.excluded.payments
+        }
+    ))
+
+
+# ===== Reads =====
+def _revenue_series_query(db: Session, vendor_id: int, granularity: str, start: datetime, end: datetime):
+    return db.query(
+        Rollup.bucket,
+        func.sum(Rollup.revenue),
+        func.sum(Rollup.payments)
+    ).filter(
+        Rollup.vendor_id == vendor_id,
+        Rollup.granularity == granularity,
+        Rollup.bucket >= bucket_start(start, granularity),
+        Rollup.bucket <= end
+    ).group_by(Rollup.bucket).order_by(Rollup.bucket)
+
+
+def get_revenue_series(db: Session, vendor_id: int, granularity: str, start: datetime, end: datetime) -> list:
+    """Revenue, payment count and average ticket per bucket in [start, end]."""
+    rows = _revenue_series_query(db, vendor_id, granularity, start, end).all()
+
+    return [
+        {
+            "bucket": bucket,
+            "revenue": round(revenue, 2),
+            "payments": payments,
+            "average_ticket": round(revenue / payments, 2) if payments else 0.0
+        }
+        for bucket, revenue, payments in rows
+    ]
+
+
+def _payer_day_range(vendor_id: int, start: datetime, end: datetime) -> tuple:
+    return (
+        DailyPayer.vendor_id == vendor_id,
+        DailyPayer.day >= bucket_start(start, "day"),
+        DailyPayer.day <= end
+    )
+
+
+def _payer_totals_query(db: Session, vendor_id: int, start: datetime, end: datetime):
+    return db.query(
+        func.coalesce(func.sum(DailyPayer.amount), 0.0),
+        func.coalesce(func.sum(DailyPayer.payments), 0),
+        func.count(func.distinct(DailyPayer.user_id))
+    ).filter(*_payer_day_range(vendor_id, start, end))
+
+
+def _top_payers_query(db: Session, vendor_id: int, start: datetime, end: datetime, top: int):
+    paid = func.sum(DailyPayer.amount).label("paid")
+    return db.query(
+        DailyPayer.user_id,
+        database.User.username,
+        paid,
+        func.sum(DailyPayer.payments)
+    ).outerjoin(
+        database.User, database.User.id == DailyPayer.user_id
+    ).filter(*_payer_day_range(vendor_id, start, end)).group_by(
+        DailyPayer.user_id, database.User.username
+    ).order_by(paid.desc()).limit(top)
+
+
+def get_vendor_summary(db: Session, vendor_id: int, start: datetime, end: datetime, top: int = 5) -> dict:
+    """Totals, unique payers and top payers over whole days [start, end]."""
+    revenue, payments, unique_payers = _payer_totals_query(db, vendor_id, start, end).one()
+    top_payers = _top_payers_query(db, vendor_id, start, end, top).all()
+
+    return {
+        "vendor_id": vendor_id,
+        "start_date": bucket_start(start, "day").date(),
+        "end_date": end.date(),
+        "total_revenue": round(revenue, 2),
+        "payments": payments,
+        "unique_payers": unique_payers,
+        "average_ticket": round(revenue / payments, 2) if payments else 0.0,
+        "top_payers": [
+            {"user_id": user_id, "name": username or "Unknown User", "amount": round(amount, 2), "payments": count}
+            for user_id, username, amount, count in top_payers
+        ]
+    }
+
+
+# ===== Rebuild / consistency check =====
+def _received_payments(db: Session):
+    return db.query(
+        database.Transaction.receiver_id,
+        database.Transaction.sender_id,
+        database.Transaction.amount,
+        database.Transaction.timestamp
+    ).filter(
+        database.Transaction.receiver_type == "vendor",
+        database.Transaction.status == "success"
+    ).execution_options(stream_results=True, yield_per=5000)
+
+
+def rebuild_vendor_rollups(db: Session) -> int:
+    """Recompute both rollup tables from transactions. Returns payments folded in."""
+    revenue_rows, payer_rows = _aggregate(tuple(row) for row in _received_payments(db))
+
+    try:
+        database.begin_write(db)
+        db.query(Rollup).delete()
+        db.query(DailyPayer).delete()
+        if revenue_rows:
+            db.bulk_insert_mappings(Rollup, revenue_rows)
+            db.bulk_insert_mappings(DailyPayer, payer_rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return sum(row["payments"] for row in revenue_rows if row["granularity"] == "month")
+
+
+def backfill_if_empty(db: Session) -> int:
+    if db.query(Rollup.id).first():
+        return 0
+    if not db.query(database.Transaction.id).filter(database.Transaction.receiver_type == "vendor").first():
+        return 0
+    return rebuild_vendor_rollups(db)
+
+
+def check_vendor_rollups(db: Session) -> list:
+    """(vendor_id, transactions total, rollup total) where the monthly rollups disagree."""
+    expected = dict(db.query(
+        database.Transaction.receiver_id, func.sum(database.Transaction.amount)
+    ).filter(
+        database.Transaction.receiver_type == "vendor",
+        database.Transaction.status == "success"
+    ).group_by(database.Transaction.receiver_id).all())
+
+    actual = dict(db.query(Rollup.vendor_id, func.sum(Rollup.revenue)).filter(
+        Rollup.granularity == "month"
+    ).group_by(Rollup.vendor_id).all())
+
+    return sorted(
+        (vendor_id, round(expected.get(vendor_id, 0.0), 2), round(actual.get(vendor_id, 0.0), 2))
+        for vendor_id in expected.keys() | actual.keys()
+        if abs(expected.get(vendor_id, 0.0) - actual.get(vendor_id, 0.0)) > 0.005
+    )
+
+
+if __name__ == "__main__":
+    # python -m backend.utils.vendor_analytics {rebuild,check}
+    parser = argparse.ArgumentParser(description="Maintain the vendor revenue rollups")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    database.init_db()
+    session = database.SessionLocal()
+    try:
+        if args.command == "rebuild":
+            print(f"Rebuilt vendor rollups from {rebuild_vendor_rollups(session)} payments")
+
+        mismatches = check_vendor_rollups(session)
+        print(f"{len(mismatches)} vendors with mismatching revenue")
+        for vendor_id, expected, actual in mismatches[:20]:
+            print(f"  vendor {vendor_id}: transactions {expected}, rollups {actual}")
+        if mismatches:
+            raise SystemExit(1)
+    finally:
+        session.close()
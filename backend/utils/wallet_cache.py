@@ -0,0 +1,77 @@
+import os
+from collections import namedtuple
+
+from sqlalchemy.orm import Session
+
+import backend.database as database
+from backend.utils.cache import TTLCache
+
+# Static identity of a wallet: never the balance, which is always read fresh.
+# `id` / `wallet_id` / `owner_type` mirror Wallet so it can stand in for the row.
+WalletOwner = namedtuple(
+    "WalletOwner",
+    ["id", "wallet_id", "owner_type", "owner_id", "merchant_name", "merchant_category"]
+)
+
+wallet_cache = TTLCache(
+    max_entries=int(os.getenv("WALLET_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("WALLET_CACHE_TTL", "300"))
+)
+
+
+def _owner_details(db: Session, owner_type: str, owner_id: int):
+    if owner_type == "vendor":
+        vendor = db.query(database.Vendor.business_name, database.Vendor.category).filter(
+            database.Vendor.id == owner_id
+        ).first()
+        return (vendor.business_name, vendor.category) if vendor else None
+
+    user = db.query(database.User.username).filter(database.User.id == owner_id).first()
+    return (user.username, "Other") if user else None
+
+
+def _load(db: Session, wallet: database.Wallet):
+    if not wallet:
+        return None
+    details = _owner_details(db, wallet.owner_type, wallet.owner_id)
+    if not details:
+        return None
+    return WalletOwner(wallet.id, wallet.wallet_id, wallet.owner_type, wallet.owner_id, *details)
+
+
+def resolve_wallet(db: Session, wallet_id: str):
+    """wallet_id -> WalletOwner (owner name / category as used for expenses)."""
+    key = ("wallet", wallet_id)
+    owner = wallet_cache.get(key)
+    if owner:
+        return owner
+
+    wallet = db.query(database.Wallet).filter(database.Wallet.wallet_id == wallet_id).first()
+    owner = _load(db, wallet)
+    if owner:
+        wallet_cache.set(key, owner)
+    return owner
+
+
+def resolve_user_wallet(db: Session, user_id: int):
+    """The paying user's wallet identity, keyed by owner instead of wallet_id."""
+    key = ("user", user_id)
+    owner = wallet_cache.get(key)
+    if owner:
+        return owner
+
+    wallet = db.query(database.Wallet).filter(
+        database.Wallet.owner_type == "user",
+        database.Wallet.owner_id == user_id
+    ).first()
+    owner = _load(db, wallet)
+    if owner:
+        wallet_cache.set(key, owner)
+    return owner
+
+
+def invalidate_owner(owner_type: str, owner_id: int) -> int:
+    """Call whenever a user/vendor profile or wallet changes."""
+    return wallet_cache.invalidate_where(
+        lambda key, owner: owner.owner_type == owner_type and owner.owner_id == owner_id
+    )
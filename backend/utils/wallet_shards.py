@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+import zlib
+
+from loguru import logger
+from sqlalchemy import false, func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import backend.database as database
+
+# 0 disables sharding; N > 0 spreads vendor credits over N sub-balance rows
+VENDOR_WALLET_SHARDS = int(os.getenv("VENDOR_WALLET_SHARDS", "0"))
+SHARD_TOTAL_TTL_SECONDS = float(os.getenv("WALLET_SHARD_CACHE_TTL", "2"))
+
+_total_cache = {}  # wallet_id -> (shard_total, expires_at)
+_cache_lock = threading.Lock()
+
+
+def is_sharded(wallet: database.Wallet) -> bool:
+    return VENDOR_WALLET_SHARDS > 0 and wallet.owner_type == "vendor"
+
+
+def sharded_clause():
+    """SQL counterpart of is_sharded(), for filtering wallet queries."""
+    return database.Wallet.owner_type == "vendor" if VENDOR_WALLET_SHARDS > 0 else false()
+
+
+def pick_shard(wallet_id: str, key: str) -> int:
+    return zlib.crc32(f"{wallet_id}:{key}".encode()) % VENDOR_WALLET_SHARDS
+
+
+def credit_shard(db: Session, wallet_id: str, amount: float, key: str):
+    """Add amount to one sub-balance row instead of the shared wallets row."""
+    shard = pick_shard(wallet_id, key)
+    credit = (
+        update(database.WalletBalanceShard)
+        .where(
+            database.WalletBalanceShard.wallet_id == wallet_id,
+            database.WalletBalanceShard.shard == shard
+        )
+        .values(balance=database.WalletBalanceShard.balance + amount)
+        .execution_options(synchronize_session=False)
+    )
+
+    if db.execute(credit).rowcount:
+        return
+
+    # First credit on this shard: create the row (another worker may win the race)
+    try:
+        with db.begin_nested():
+            db.add(database.WalletBalanceShard(wallet_id=wallet_id, shard=shard, balance=amount))
+    except IntegrityError:
+        db.execute(credit)
+
+
+def invalidate_shard_total(wallet_id: str):
+    with _cache_lock:
+        _total_cache.pop(wallet_id, None)
+
+
+def get_shard_total(db: Session, wallet_id: str) -> float:
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _total_cache.get(wallet_id)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    total = db.query(func.coalesce(func.sum(database.WalletBalanceShard.balance), 0.0)).filter(
+        database.WalletBalanceShard.wallet_id == wallet_id
+    ).scalar()
+
+    with _cache_lock:
+        _total_cache[wallet_id] = (float(total), now + SHARD_TOTAL_TTL_SECONDS)
+    return float(total)
+
+
+def get_wallet_balance(db: Session, wallet: database.Wallet) -> float:
+    """Single balance for a wallet, including any not-yet-consolidated shards."""
+    if wallet.owner_type != "vendor":
+        return wallet.balance
+    return wallet.balance + get_shard_total(db, wallet.wallet_id)
+
+
+def consolidate_wallet_shards():
+    """
+    Fold shard balances back into wallets.balance.
+
+    Each shard is decremented by the amount that was read rather than zeroed,
+    so credits landing while the job runs are kept for the next pass.
+    """
+    db = database.SessionLocal()
+    try:
+        wallet_ids = [
+            row[0] for row in db.query(database.WalletBalanceShard.wallet_id).filter(
+                database.WalletBalanceShard.balance != 0
+            ).distinct().all()
+        ]
+
+        for wallet_id in wallet_ids:
+            database.begin_write(db)
+            shards = db.query(
+                database.WalletBalanceShard.id,
+                database.WalletBalanceShard.balance
+            ).filter(database.WalletBalanceShard.wallet_id == wallet_id).all()
+
+            total = 0.0
+            for shard_id, balance in shards:
+                if not balance:
+                    continue
+                db.execute(
+                    update(database.WalletBalanceShard)
+                    .where(database.WalletBalanceShard.id == shard_id)
+                    .values(balance=database.WalletBalanceShard.balance - balance)
+                    .execution_options(synchronize_session=False)
+                )
+                total += balance
+
+            db.execute(
+                update(database.Wallet)
+                .where(database.Wallet.wallet_id == wallet_id)
+                .values(balance=database.Wallet.balance + total)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            invalidate_shard_total(wallet_id)
+
+        if wallet_ids:
+            logger.info(f"Consolidated shard balances for {len(wallet_ids)} wallets")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"ERROR in shard consolidation: {e}")
+    finally:
+        db.close()